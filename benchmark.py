@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+FILE_TYPES = [".py", ".js", ".json", ".md", ".txt", ".css", ".html"]
+OTHER_TYPES = [".png", ".log", ".csv"]
+DIR_NAMES = ["src", "lib", "app", "core", "utils", "tests", "docs", "api", "models", "static"]
+WORDS = ["def", "class", "return", "import", "value", "config", "parser", "файл", "строка", "данные"]
+TREE_MARKER = ".pyparser_bench"
+STAGES = ["walk", "exclude", "read", "collect", "collect_incremental", "structure", "end_to_end"]
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def make_content(rng, size, encoding):
+    lines = []
+    length = 0
+    while length < size:
+        indent = "    " * rng.randint(0, 3)
+        line = indent + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 10)))
+        lines.append(line)
+        length += len(line) + 1
+
+    text = "\n".join(lines) + "\n"
+    if encoding == "latin-1":
+        text = text.encode("ascii", "replace").decode("ascii")
+    return text.encode(encoding)
+
+
+def generate_tree(root, seed=0, depth=4, fanout=4, files=2000, size_min=200, size_max=64 * 1024,
+                  encodings="utf-8=0.85,cp1251=0.08,utf-16=0.04,utf-8-sig=0.03",
+                  excluded_dirs=".venv,node_modules,__pycache__", excluded_ratio=0.1):
+    rng = random.Random(seed)
+    encoding_mix = parse_mix(encodings)
+    excluded_names = [name for name in excluded_dirs.split(',') if name]
+
+    dirs = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(rng.randint(1, fanout)):
+                if excluded_names and rng.random() < excluded_ratio:
+                    name = rng.choice(excluded_names)
+                else:
+                    name = f"{rng.choice(DIR_NAMES)}{i}"
+                path = os.path.join(parent, name)
+                if path not in dirs:
+                    dirs.append(path)
+                    next_level.append(path)
+        level = next_level
+
+    for path in dirs:
+        os.makedirs(path, exist_ok=True)
+
+    total_bytes = 0
+    names = list(encoding_mix)
+    weights = [encoding_mix[name] for name in names]
+    for i in range(files):
+        directory = rng.choice(dirs)
+        ext = rng.choice(FILE_TYPES) if rng.random() < 0.9 else rng.choice(OTHER_TYPES)
+        size = int(math.exp(rng.uniform(math.log(size_min), math.log(size_max))))
+        data = make_content(rng, size, rng.choices(names, weights)[0])
+        with open(os.path.join(directory, f"file{i}{ext}"), 'wb') as f:
+            f.write(data)
+        total_bytes += len(data)
+
+    return {"dirs": len(dirs), "files": files, "bytes": total_bytes}
+
+
+def load_module(module_path):
+    spec = importlib.util.spec_from_file_location("pyparser_bench", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def clean_outputs(root):
+    for name in ["code.txt", "structure.txt", "selected_code.txt", "pyparser_manifest.json"]:
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(os.path.join(root, ".pyparser_cache"), ignore_errors=True)
+
+
+def file_bytes(parser, files):
+    return sum(os.path.getsize(parser.fs_path(file_path)) for file_path in files)
+
+
+def run_stage(task):
+    module_path, root, stage, excluded = task
+    module = load_module(module_path)
+    parser = module.make_parser(root, excluded=excluded)
+    parser.config["auto_gitignore"] = False
+
+    if stage in ("collect", "structure", "end_to_end"):
+        clean_outputs(root)
+    elif stage == "collect_incremental":
+        clean_outputs(root)
+        parser.collect_all_files()
+    elif stage in ("exclude", "read"):
+        files = parser.find_files_by_types()[0]
+        paths = [os.path.join(path, name) for path, dirs, names in os.walk(root) for name in dirs + names]
+
+    start = time.perf_counter()
+    if stage == "walk":
+        files = parser.find_files_by_types()[0]
+    elif stage == "exclude":
+        for path in paths:
+            parser.should_exclude(path)
+    elif stage == "read":
+        for file_path in files:
+            parser.try_read_file(file_path)
+    elif stage in ("collect", "collect_incremental"):
+        result = parser.collect_all_files()
+    elif stage == "structure":
+        parser.generate_structure()
+    elif stage == "end_to_end":
+        result = parser.collect_all_with_structure()
+    seconds = time.perf_counter() - start
+
+    if stage == "exclude":
+        count, size = len(paths), 0
+    elif stage in ("collect", "collect_incremental", "end_to_end"):
+        count, size = result["files"], result["bytes"]
+    else:
+        if stage == "structure":
+            files = parser.find_files_by_types()[0]
+        count, size = len(files), file_bytes(parser, files)
+
+    return {"seconds": seconds, "files": count, "bytes": size, "peak_rss_mb": peak_rss_mb()}
+
+
+def measure(module_path, root, stage, excluded, repeat):
+    runs = []
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(run_stage, (module_path, root, stage, excluded)).result())
+
+    seconds = [run["seconds"] for run in runs]
+    best = min(seconds)
+    last = runs[-1]
+    rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    return {
+        "seconds": round(best, 4),
+        "median_seconds": round(statistics.median(seconds), 4),
+        "files": last["files"],
+        "bytes": last["bytes"],
+        "files_per_s": round(last["files"] / best, 1) if best else None,
+        "mb_per_s": round(last["bytes"] / (1024 * 1024) / best, 2) if best and last["bytes"] else None,
+        "peak_rss_mb": max(rss) if rss else None,
+    }
+
+
+def git_revision(module_path):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(module_path) or ".",
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    module_path = os.path.abspath(args.module)
+    tree_params = {
+        "seed": args.seed,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "files": args.files,
+        "size_min": args.size_min,
+        "size_max": args.size_max,
+        "encodings": args.encodings,
+        "excluded_dirs": args.excluded_dirs,
+        "excluded_ratio": args.excluded_ratio,
+    }
+
+    root = args.tree_dir or tempfile.mkdtemp(prefix="pyparser_bench_")
+    if os.path.isdir(root) and os.listdir(root):
+        if not os.path.exists(os.path.join(root, TREE_MARKER)):
+            raise SystemExit(f"Папка {root} не пуста и создана не бенчмарком")
+        shutil.rmtree(root)
+
+    print(f"Генерация дерева в {root}...")
+    tree = generate_tree(root, **tree_params)
+    open(os.path.join(root, TREE_MARKER), 'w').close()
+    print(f"✓ Папок: {tree['dirs']}, файлов: {tree['files']}, объем: {tree['bytes'] / (1024 * 1024):.1f} МБ")
+
+    excluded = [name for name in args.excluded_dirs.split(',') if name]
+    stages = args.stages.split(',') if args.stages else STAGES
+    results = {}
+    try:
+        for stage in stages:
+            if stage not in STAGES:
+                raise SystemExit(f"Неизвестный этап: {stage}")
+            results[stage] = measure(module_path, root, stage, excluded, args.repeat)
+            print_stage(stage, results[stage])
+    finally:
+        if not args.keep and not args.tree_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(module_path),
+        "module": module_path,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        "tree": dict(tree_params, **tree),
+        "stages": results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✓ Результаты сохранены в: {args.output}")
+    return 0
+
+
+def print_stage(stage, result):
+    rate = f"{result['files_per_s']} файлов/с"
+    if result["mb_per_s"] is not None:
+        rate += f", {result['mb_per_s']} МБ/с"
+    rss = f", пик RSS {result['peak_rss_mb']} МБ" if result["peak_rss_mb"] is not None else ""
+    print(f"  {stage:<20} {result['seconds']:>8.3f} с  ({rate}{rss})")
+
+
+def compare_reports(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+
+    if baseline.get("tree") != current.get("tree"):
+        print("⚠ Параметры дерева отличаются, сравнение может быть некорректным")
+
+    regressions = []
+    print(f"{'этап':<20} {'было, с':>10} {'стало, с':>10} {'изм.':>8} {'RSS было':>10} {'RSS стало':>10}")
+    for stage, new in current["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+
+        change = (new["seconds"] - old["seconds"]) / old["seconds"] if old["seconds"] else 0.0
+        mark = ""
+        if change > args.threshold:
+            regressions.append(stage)
+            mark = " ✗"
+        print(f"{stage:<20} {old['seconds']:>10.3f} {new['seconds']:>10.3f} {change:>+8.1%} "
+              f"{str(old.get('peak_rss_mb')):>10} {str(new.get('peak_rss_mb')):>10}{mark}")
+
+    if regressions:
+        print(f"\n✗ Замедление больше {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\n✓ Регрессий не найдено")
+    return 0
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Замеры производительности PyParser")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Сгенерировать дерево и замерить этапы")
+    run_parser.add_argument("--module", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyparser.py"),
+                            help="Путь к проверяемому pyparser.py")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--depth", type=int, default=4)
+    run_parser.add_argument("--fanout", type=int, default=4)
+    run_parser.add_argument("--files", type=int, default=2000)
+    run_parser.add_argument("--size-min", type=int, default=200)
+    run_parser.add_argument("--size-max", type=int, default=64 * 1024)
+    run_parser.add_argument("--encodings", default="utf-8=0.85,cp1251=0.08,utf-16=0.04,utf-8-sig=0.03",
+                            help="Доли кодировок, например utf-8=0.9,cp1251=0.1")
+    run_parser.add_argument("--excluded-dirs", default=".venv,node_modules,__pycache__")
+    run_parser.add_argument("--excluded-ratio", type=float, default=0.1)
+    run_parser.add_argument("--stages", help=f"Этапы через запятую ({','.join(STAGES)})")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--tree-dir", help="Папка для дерева (будет пересоздана)")
+    run_parser.add_argument("--keep", action="store_true", help="Не удалять временное дерево")
+    run_parser.add_argument("-o", "--output", help="JSON-файл с результатами")
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два JSON-отчета")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое замедление (0.1 = 10%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "compare":
+        return compare_reports(args)
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,2050 @@
 import os
+import re
+import queue
 import json
+import argparse
+import ast
+import asyncio
+import codecs
 import fnmatch
+import heapq
+import hashlib
+import io
+import itertools
+import selectors
+import struct
+import threading
+import time
+import tokenize
+import zlib
+from array import array
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import sys
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import ctypes
+except ImportError:
+    ctypes = None
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "xz": ".xz"}
+STREAM_CHUNK_SIZE = 1024 * 1024
+BYTES_PER_TOKEN = 4
+SHARD_FILES_GLOB = "code.[0-9][0-9][0-9].txt*"
+ENCODING_PROBE_SIZE = 64 * 1024
+
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_FALLBACK_ENCODINGS = ('cp1251', 'latin-1')
+
+BINARY_SNIFF_SIZE = 8 * 1024
+_CONTROL_BYTES = bytes(byte for byte in range(32) if byte not in b'\t\n\x0b\x0c\r\x1b') + b'\x7f'
+
+_LINE_BREAKS = re.compile('[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+_RAW_LINE_BREAKS = re.compile(b'[\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+_RAW_PARTIAL_BREAKS = (b'\r', b'\xc2', b'\xe2', b'\xe2\x80')
+
+_BREAK_CHARS = ('\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029')
+_RAW_BREAK_CHARS = tuple(char.encode('utf-8') for char in _BREAK_CHARS)
+
+
+def normalize_newlines(text):
+    if '\r\n' in text:
+        text = text.replace('\r\n', '\n')
+    if any(char in text for char in _BREAK_CHARS):
+        text = _LINE_BREAKS.sub('\n', text)
+    return text
+
+
+def normalize_utf8_newlines(data):
+    if b'\r\n' in data:
+        data = data.replace(b'\r\n', b'\n')
+    if any(char in data for char in _RAW_BREAK_CHARS):
+        data = _RAW_LINE_BREAKS.sub(b'\n', data)
+    return data
+
+
+def sniff_encoding(prefix):
+    for bom, encoding in _BOM_ENCODINGS:
+        if prefix.startswith(bom):
+            return encoding
+
+    sample = prefix[:4096]
+    half = len(sample) // 2
+    if half < 2:
+        return None
+
+    even_nuls = sample[0:half * 2:2].count(0)
+    odd_nuls = sample[1:half * 2:2].count(0)
+    if odd_nuls > half * 0.4 and even_nuls < half * 0.05:
+        return 'utf-16-le'
+    if even_nuls > half * 0.4 and odd_nuls < half * 0.05:
+        return 'utf-16-be'
+    return None
+
+
+def looks_binary(prefix):
+    if not prefix or sniff_encoding(prefix) is not None:
+        return False
+    if b'\x00' in prefix:
+        return True
+
+    control_count = len(prefix) - len(prefix.translate(None, _CONTROL_BYTES))
+    return control_count > len(prefix) * 0.3
+
+
+def format_size(size):
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def count_lines(path):
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            if last == b'\n' and lines == 0 and looks_binary(chunk[:BINARY_SNIFF_SIZE]):
+                return 0
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    return lines + (last != b'\n')
+
+
+class SkipFile(Exception):
+    pass
+
+
+def utf8_prefix_ok(prefix, complete):
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, complete)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_and_decode(raw_data, hint=None):
+    for encoding in (hint, sniff_encoding(raw_data[:ENCODING_PROBE_SIZE])):
+        if encoding:
+            try:
+                return raw_data.decode(encoding), encoding
+            except (UnicodeDecodeError, LookupError):
+                pass
+
+    prefix = raw_data[:ENCODING_PROBE_SIZE]
+    if utf8_prefix_ok(prefix, len(prefix) == len(raw_data)):
+        try:
+            return raw_data.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            pass
+
+    for encoding in _FALLBACK_ENCODINGS:
+        try:
+            return raw_data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+
+
+class EncodingCache:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = None
+        self.dirty = False
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        self.entries = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, file_path, st):
+        if self.entries is None:
+            return None
+        entry = self.entries.get(file_path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, file_path, st, encoding):
+        if self.entries is None:
+            return
+        entry = [st.st_size, st.st_mtime_ns, encoding]
+        if self.entries.get(file_path) != entry:
+            self.entries[file_path] = entry
+            self.dirty = True
+
+    def retain(self, file_paths):
+        if self.entries is None:
+            return
+        keep = set(file_paths)
+        for file_path in [path for path in self.entries if path not in keep]:
+            del self.entries[file_path]
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        self.dirty = False
+
+
+class OutlineCache(EncodingCache):
+    def get(self, digest):
+        if self.entries is None:
+            return None
+        return self.entries.get(digest)
+
+    def put(self, digest, outline):
+        if self.entries is None:
+            return
+        if self.entries.get(digest) != [outline]:
+            self.entries[digest] = [outline]
+            self.dirty = True
+
+
+_TRY_STAR = (ast.TryStar,) if hasattr(ast, "TryStar") else ()
+
+
+def _docstring_line(node, indent):
+    doc = ast.get_docstring(node)
+    if not doc or not doc.strip():
+        return None
+    first = doc.strip().splitlines()[0].strip().replace('\\', '\\\\')
+    if first.endswith('"'):
+        first = first[:-1] + '\\"'
+    first = first.replace('"""', '\\"\\"\\"')
+    return f'{indent}"""{first}"""'
+
+
+def _signature(node):
+    type_params = getattr(node, "type_params", None)
+    params = f"[{', '.join(ast.unparse(param) for param in type_params)}]" if type_params else ""
+
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(keyword) for keyword in node.keywords]
+        return f"class {node.name}{params}({', '.join(bases)})" if bases else f"class {node.name}{params}"
+
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    header = f"{prefix} {node.name}{params}({ast.unparse(node.args)})"
+    if node.returns is not None:
+        header += f" -> {ast.unparse(node.returns)}"
+    return header
+
+
+def _outline_body(body, lines, indent):
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(indent + ast.unparse(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            start = len(lines)
+            lines.append(f"{indent}{_signature(node)}:")
+
+            doc = _docstring_line(node, indent + "    ")
+            if doc is not None:
+                lines.append(doc)
+            if isinstance(node, ast.ClassDef):
+                _outline_body(node.body, lines, indent + "    ")
+            if len(lines) == start + 1:
+                lines[start] += " ..."
+        elif isinstance(node, (ast.If, ast.Try, ast.With, ast.AsyncWith) + _TRY_STAR):
+            _outline_body(node.body, lines, indent)
+            for handler in getattr(node, "handlers", ()):
+                _outline_body(handler.body, lines, indent)
+            _outline_body(getattr(node, "orelse", ()), lines, indent)
+            _outline_body(getattr(node, "finalbody", ()), lines, indent)
+
+
+def python_outline(source):
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+
+    lines = []
+    doc = _docstring_line(tree, "")
+    if doc is not None:
+        lines.append(doc)
+    try:
+        _outline_body(tree.body, lines, "")
+    except RecursionError:
+        return None
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+STRIP_KINDS = {
+    ".py": "python", ".pyw": "python", ".pyi": "python",
+    ".js": "js", ".mjs": "js", ".cjs": "js",
+    ".css": "css",
+    ".html": "html", ".htm": "html",
+}
+
+_STRIP_PATTERNS = {
+    "css": re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|(/\*.*?(?:\*/|\Z))', re.DOTALL),
+    "html": re.compile(r'(<script\b.*?(?:</script\s*>|\Z)|<style\b.*?(?:</style\s*>|\Z))'
+                       r'|(<!--(?!\[if).*?(?:-->|\Z))', re.DOTALL | re.IGNORECASE),
+}
+_JS_CHUNK = re.compile(r'[^"\'`/]+|"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?|`(?:\\.|[^`\\])*`?'
+                       r'|/\*.*?(?:\*/|\Z)|//[^\n]*|/', re.DOTALL)
+_JS_REGEX = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[A-Za-z]*')
+# После этих символов и слов "/" начинает регулярное выражение, а не деление
+_JS_REGEX_AFTER = re.compile(r'(?:^|[(,=:\[!&|?{};+\-*%<>~^]|\b(?:return|typeof|case|do|else|in|of|new|delete|void'
+                             r'|throw|instanceof|yield|await))$')
+_STRING_STARTS = {getattr(tokenize, name) for name in ("FSTRING_START", "TSTRING_START") if hasattr(tokenize, name)}
+_STRING_ENDS = {getattr(tokenize, name) for name in ("FSTRING_END", "TSTRING_END") if hasattr(tokenize, name)}
+
+
+def _js_comment_spans(source):
+    spans = []
+    tail = ""
+    pos = 0
+    while pos < len(source):
+        match = _JS_CHUNK.match(source, pos)
+        chunk = match.group()
+        if chunk.startswith(('/*', '//')):
+            spans.append((pos, match.end(), ''))
+        elif chunk == '/' and _JS_REGEX_AFTER.search(tail) and not tail.endswith(('++', '--')):
+            literal = _JS_REGEX.match(source, pos)
+            if literal is not None:
+                tail = "x"
+                pos = literal.end()
+                continue
+            tail = "/"
+        elif chunk[0] in '"\'`':
+            tail = "x"
+        elif chunk.strip():
+            tail = chunk.rstrip()[-16:]
+        pos = match.end()
+    return spans
+
+
+def _cut_spans(text, spans):
+    parts = []
+    pos = 0
+    for start, end, replacement in sorted(spans):
+        if start < pos:
+            continue
+        # Вырезанный текст оставляет свои переводы строк, чтобы номера строк не сдвигались
+        parts.append(text[pos:start])
+        parts.append(replacement + '\n' * text.count('\n', start, end))
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def compact_lines(original, stripped, keep=()):
+    lines = []
+    blank = True
+    for number, (old, new) in enumerate(zip(original.split('\n'), stripped.split('\n')), 1):
+        if number in keep:
+            lines.append(new)
+            blank = False
+            continue
+
+        new = new.rstrip()
+        if not new:
+            if blank or old.strip():
+                continue
+            blank = True
+        else:
+            blank = False
+        lines.append(new)
+
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _python_spans(source):
+    offsets = [0]
+    for line in source.split('\n'):
+        offsets.append(offsets[-1] + len(line) + 1)
+
+    def position(point):
+        return offsets[point[0] - 1] + point[1]
+
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    code = [token for token in tokens if token.type not in (tokenize.NL, tokenize.COMMENT)]
+    spans = [(position(token.start), position(token.end), '') for token in tokens if token.type == tokenize.COMMENT]
+    removed = set()
+    statements = {}
+
+    for i, token in enumerate(code):
+        if token.type != tokenize.STRING or (i and code[i - 1].type not in (tokenize.NEWLINE, tokenize.INDENT,
+                                                                               tokenize.DEDENT)):
+            continue
+        last = i
+        while code[last + 1].type == tokenize.STRING:
+            last += 1
+        if code[last + 1].type != tokenize.NEWLINE:
+            continue
+
+        statements[i] = len(spans)
+        spans.append((position(token.start), position(code[last].end), ''))
+        removed.update(range(i, last + 1))
+
+    # Блок, в котором были только строки: оставляем заглушку, чтобы код оставался корректным
+    blocks = []
+    for i, token in enumerate(code):
+        if token.type == tokenize.INDENT:
+            blocks.append([False, None])
+        elif token.type == tokenize.DEDENT:
+            kept, span = blocks.pop()
+            if not kept and span is not None:
+                spans[span] = spans[span][:2] + ('...',)
+        elif blocks and token.type != tokenize.ENDMARKER and code[i - 1].type in (tokenize.NEWLINE, tokenize.INDENT,
+                                                                                   tokenize.DEDENT):
+            if i not in statements:
+                blocks[-1][0] = True
+            elif blocks[-1][1] is None:
+                blocks[-1][1] = statements[i]
+
+    keep = set()
+    opened = []
+    for i, token in enumerate(code):
+        if token.type in _STRING_STARTS:
+            opened.append(token.start[0])
+        elif token.type in _STRING_ENDS:
+            first = opened.pop()
+            if not opened:
+                keep.update(range(first, token.end[0]))
+        elif token.type == tokenize.STRING and i not in removed:
+            keep.update(range(token.start[0], token.end[0]))
+    return spans, keep
+
+
+def strip_source(source, kind):
+    source = source.replace('\r\n', '\n').replace('\r', '\n')
+    if kind == "python":
+        try:
+            spans, keep = _python_spans(source)
+        except (tokenize.TokenError, SyntaxError, IndexError):
+            return None
+    elif kind == "js":
+        spans, keep = _js_comment_spans(source), ()
+    else:
+        spans = [(match.start(2), match.end(2), '') for match in _STRIP_PATTERNS[kind].finditer(source)
+                 if match.group(2) is not None]
+        keep = ()
+    return compact_lines(source, _cut_spans(source, spans), keep)
+
+
+class ExclusionMatcher:
+    def __init__(self, patterns, root="."):
+        root_str = str(Path(root).absolute()).replace('\\', '/')
+        self.root = root_str
+        self.root_lower = root_str.lower()
+        self.patterns = [pattern.strip() for pattern in patterns if pattern.strip()]
+        self._pattern_matchers = None
+
+        names = set()
+        rel_exact = set()
+        rel_prefixes = []
+        full_suffixes = []
+        abs_prefixes = []
+        globs = []
+
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern:
+                continue
+
+            pattern_lower = pattern.lower().replace('\\', '/')
+
+            if os.path.isabs(pattern):
+                pattern_str = str(Path(pattern).absolute()).replace('\\', '/')
+                abs_prefixes.append(pattern_str.lower())
+            elif pattern_lower.endswith('/*'):
+                dir_pattern = pattern_lower[:-2]
+                rel_exact.add(dir_pattern)
+                rel_prefixes.append(dir_pattern + '/')
+                full_suffixes.append('/' + dir_pattern)
+                full_suffixes.append('/' + dir_pattern + '/')
+            elif '*' in pattern_lower:
+                globs.append(fnmatch.translate(pattern_lower))
+            elif '/' in pattern_lower:
+                rel_exact.add(pattern_lower)
+                full_suffixes.append('/' + pattern_lower)
+            else:
+                names.add(pattern_lower)
+
+        self.names = frozenset(names)
+        self.rel_exact = frozenset(rel_exact)
+        self.rel_prefixes = tuple(rel_prefixes)
+        self.full_suffixes = tuple(full_suffixes)
+        self.abs_prefixes = tuple(abs_prefixes)
+        self.glob = re.compile('|'.join(globs)).match if globs else None
+        self.needs_path = bool(rel_exact or abs_prefixes or globs)
+
+    def parts_of(self, path):
+        path_str = str(Path(path).absolute()).replace('\\', '/')
+        if path_str.lower().startswith(self.root_lower + '/'):
+            return tuple(path_str[len(self.root) + 1:].lower().split('/'))
+        if path_str.lower() == self.root_lower:
+            return ()
+        return None
+
+    def match(self, parts):
+        if self.names and not self.names.isdisjoint(parts):
+            return True
+        if not self.needs_path:
+            return False
+
+        rel_lower = '/'.join(parts)
+        return self._match_strings(rel_lower, self.root_lower + '/' + rel_lower, parts[-1])
+
+    def match_path(self, path):
+        try:
+            abs_path = Path(path).absolute()
+        except Exception:
+            return False
+
+        path_lower = str(abs_path).replace('\\', '/').lower()
+
+        if path_lower.startswith(self.root_lower + '/'):
+            rel_lower = path_lower[len(self.root_lower) + 1:]
+        else:
+            rel_lower = path_lower
+
+        parts = rel_lower.split('/')
+        if self.names and not self.names.isdisjoint(parts):
+            return True
+        if not self.needs_path:
+            return False
+
+        return self._match_strings(rel_lower, path_lower, parts[-1])
+
+    def explain(self, parts):
+        return next((pattern for pattern, matcher in self.pattern_matchers() if matcher.match(parts)), None)
+
+    def explain_path(self, path):
+        return next((pattern for pattern, matcher in self.pattern_matchers() if matcher.match_path(path)), None)
+
+    def pattern_matchers(self):
+        if self._pattern_matchers is None:
+            self._pattern_matchers = [(pattern, ExclusionMatcher([pattern], self.root)) for pattern in self.patterns]
+        return self._pattern_matchers
+
+    def _match_strings(self, rel_lower, path_lower, name_lower):
+        if rel_lower in self.rel_exact:
+            return True
+        if self.rel_prefixes and rel_lower.startswith(self.rel_prefixes):
+            return True
+        if self.full_suffixes and path_lower.endswith(self.full_suffixes):
+            return True
+        if self.abs_prefixes and path_lower.startswith(self.abs_prefixes):
+            return True
+        if self.glob is not None:
+            if self.glob(rel_lower) or self.glob(path_lower) or self.glob(name_lower):
+                return True
+        return False
+
+
+def _gitignore_glob(pattern):
+    out = []
+    i, n = 0, len(pattern)
+
+    while i < n:
+        char = pattern[i]
+        if char == '*':
+            if pattern.startswith('**', i) and (i == 0 or pattern[i - 1] == '/'):
+                if pattern[i + 2:i + 3] == '/':
+                    out.append('(?:.*/)?')
+                    i += 3
+                    continue
+                if i + 2 == n:
+                    out.append('.*')
+                    i += 2
+                    continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            out.append('[^/]*')
+            continue
+
+        if char == '?':
+            out.append('[^/]')
+        elif char == '[':
+            end = i + 1
+            if end < n and pattern[end] in '!^':
+                end += 1
+            if end < n and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\').replace('[', '\\[')
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                out.append(f'(?!/)[{body}]')
+                i = end
+        elif char == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+
+    return ''.join(out)
+
+
+class GitIgnore:
+    flags = re.IGNORECASE if sys.platform in ("win32", "darwin") else 0
+
+    def __init__(self, lines, strip="", prepend=""):
+        self.strip = strip
+        self.prepend = prepend
+        self.negated = []
+        file_rules = []
+        dir_rules = []
+
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line or line.startswith('#'):
+                continue
+            while line.endswith(' ') and not line.endswith('\\ '):
+                line = line[:-1]
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            anchored = '/' in line
+            regex = _gitignore_glob(line[1:] if line.startswith('/') else line)
+            if not anchored:
+                regex = '(?:.*/)?' + regex
+
+            group = f"(?P<r{len(self.negated)}>{regex})"
+            self.negated.append(negate)
+            dir_rules.append(group)
+            if not dir_only:
+                file_rules.append(group)
+
+        self.match_file = self._compile(file_rules)
+        self.match_dir = self._compile(dir_rules)
+
+    def _compile(self, rules):
+        if not rules:
+            return None
+        return re.compile('|'.join(reversed(rules)), self.flags).fullmatch
+
+    def __bool__(self):
+        return bool(self.negated)
+
+    @classmethod
+    def load(cls, path, strip="", prepend=""):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                ignore = cls(f, strip, prepend)
+        except OSError:
+            return None
+        return ignore if ignore else None
+
+    def match(self, rel_path, is_dir):
+        matcher = self.match_dir if is_dir else self.match_file
+        if matcher is None:
+            return None
+
+        found = matcher(self.prepend + rel_path[len(self.strip):])
+        if found is None:
+            return None
+        return not self.negated[int(found.lastgroup[1:])]
+
+
+class GitIgnoreChain:
+    def __init__(self, rules=(), rel=""):
+        self.rules = rules
+        self.rel = rel
+
+    def rel_path(self, name):
+        return f"{self.rel}/{name}" if self.rel else name
+
+    def child(self, name, path):
+        rel = self.rel_path(name)
+        ignore = GitIgnore.load(os.path.join(path, ".gitignore"), rel + "/")
+        return GitIgnoreChain(self.rules + (ignore,) if ignore else self.rules, rel)
+
+    def match(self, name, is_dir):
+        if name == ".git":
+            return True
+
+        rel = self.rel_path(name)
+        for ignore in reversed(self.rules):
+            result = ignore.match(rel, is_dir)
+            if result is not None:
+                return result
+        return False
+
+
+_INDEX_ENTRY = struct.Struct('>10I')
+
+
+def find_git_dir(root):
+    root_abs = Path(root).absolute()
+    for top in (root_abs, *root_abs.parents):
+        dot_git = top / ".git"
+        if dot_git.is_dir():
+            return top, dot_git
+        if dot_git.is_file():
+            try:
+                text = dot_git.read_text(encoding='utf-8').strip()
+            except OSError:
+                return None
+            if not text.startswith("gitdir:"):
+                return None
+            git_dir = Path(text[len("gitdir:"):].strip())
+            return top, git_dir if git_dir.is_absolute() else top / git_dir
+    return None
+
+
+def git_hash_size(git_dir):
+    try:
+        config = (git_dir / "config").read_text(encoding='utf-8', errors='replace')
+    except OSError:
+        config = ""
+    return 32 if re.search(r'objectformat\s*=\s*sha256', config, re.IGNORECASE) else 20
+
+
+def _read_varint(data, pos):
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
+
+
+def read_git_index(index_path, hash_size=20):
+    with open(index_path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < 12 or data[:4] != b'DIRC':
+        raise ValueError("не индекс git")
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in (2, 3, 4):
+        raise ValueError(f"неподдерживаемая версия индекса: {version}")
+
+    entries = []
+    seen = set()
+    pos = 12
+    path = b''
+
+    for _ in range(count):
+        start = pos
+        fields = _INDEX_ENTRY.unpack_from(data, pos)
+        pos += _INDEX_ENTRY.size + hash_size
+        flags, = struct.unpack_from('>H', data, pos)
+        pos += 2
+
+        skip_worktree = False
+        if flags & 0x4000:
+            extended, = struct.unpack_from('>H', data, pos)
+            pos += 2
+            skip_worktree = bool(extended & 0x4000)
+
+        if version == 4:
+            strip, pos = _read_varint(data, pos)
+            end = data.index(b'\0', pos)
+            path = path[:len(path) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            end = data.index(b'\0', pos)
+            path = data[pos:end]
+            pos = start + ((end - start) // 8 + 1) * 8
+
+        mode = fields[6] >> 12
+        if skip_worktree or mode not in (0o10, 0o12) or path in seen:
+            continue
+
+        seen.add(path)
+        name = data[start + _INDEX_ENTRY.size:start + _INDEX_ENTRY.size + hash_size].hex()
+        entries.append((os.fsdecode(path), fields[9], fields[2] * 1_000_000_000 + fields[3], name))
+
+    end = len(data) - hash_size
+    while pos + 8 <= end:
+        signature = data[pos:pos + 4]
+        size, = struct.unpack_from('>I', data, pos + 4)
+        if signature == b'link':
+            raise ValueError("split index не поддерживается")
+        pos += 8 + size
+
+    return entries
+
+
+def _index_sort_key(names):
+    return [(1, name.lower(), name) for name in names[:-1]] + [(0, names[-1].lower(), names[-1])]
+
+
+_PACK_OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+
+def _delta_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def apply_git_delta(base, delta):
+    _, pos = _delta_varint(delta, 0)
+    size, pos = _delta_varint(delta, pos)
+    out = bytearray()
+
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = length = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    length |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + (length or 0x10000)]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("повреждена дельта git")
+
+    if len(out) != size:
+        raise ValueError("неверный размер объекта после дельты git")
+    return bytes(out)
+
+
+def _inflate_at(f, offset):
+    f.seek(offset)
+    decompressor = zlib.decompressobj()
+    chunks = []
+    while not decompressor.eof:
+        chunk = f.read(64 * 1024)
+        if not chunk:
+            raise ValueError("обрезанный объект в pack-файле")
+        chunks.append(decompressor.decompress(chunk))
+    return b''.join(chunks)
+
+
+def git_blob_hash(f, hash_size=20):
+    digest = hashlib.sha256() if hash_size == 32 else hashlib.sha1()
+    digest.update(b"blob %d\0" % os.fstat(f.fileno()).st_size)
+    while True:
+        chunk = f.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+
+
+class _GitPack:
+    def __init__(self, idx_path, hash_size):
+        with open(idx_path, 'rb') as f:
+            data = f.read()
+        if data[:4] != b'\xfftOc' or struct.unpack_from('>I', data, 4)[0] != 2:
+            raise ValueError(f"неподдерживаемый формат {idx_path}")
+
+        self.path = str(idx_path)[:-len(".idx")] + ".pack"
+        self.hash_size = hash_size
+        self.data = data
+        self.fanout = struct.unpack_from('>256I', data, 8)
+        self.count = self.fanout[255]
+        self.names_at = 8 + 256 * 4
+        self.offsets_at = self.names_at + self.count * (hash_size + 4)
+
+    def name(self, i):
+        start = self.names_at + i * self.hash_size
+        return self.data[start:start + self.hash_size].hex()
+
+    def _position(self, prefix):
+        first = int(prefix[:2], 16)
+        lo, hi = (self.fanout[first - 1] if first else 0), self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_prefix(self, prefix):
+        found = []
+        i = self._position(prefix)
+        while i < self.count and self.name(i).startswith(prefix):
+            found.append(self.name(i))
+            i += 1
+        return found
+
+    def offset(self, name):
+        i = self._position(name)
+        if i >= self.count or self.name(i) != name:
+            return None
+        offset, = struct.unpack_from('>I', self.data, self.offsets_at + i * 4)
+        if offset & 0x80000000:
+            large_at = self.offsets_at + self.count * 4 + (offset & 0x7fffffff) * 8
+            offset, = struct.unpack_from('>Q', self.data, large_at)
+        return offset
+
+    def read(self, offset, repo):
+        with open(self.path, 'rb') as f:
+            return self._read_at(f, offset, repo)
+
+    def _read_at(self, f, offset, repo):
+        f.seek(offset)
+        header = f.read(64)
+        byte = header[0]
+        kind = (byte >> 4) & 7
+        pos = 1
+        while byte & 0x80:
+            byte = header[pos]
+            pos += 1
+
+        if kind == 6:
+            distance, pos = _read_varint(header, pos)
+            base = self._read_at(f, offset - distance, repo)
+        elif kind == 7:
+            base = repo.read_object(header[pos:pos + self.hash_size].hex())
+            pos += self.hash_size
+        elif kind in _PACK_OBJECT_TYPES:
+            return _PACK_OBJECT_TYPES[kind], _inflate_at(f, offset + pos)
+        else:
+            raise ValueError(f"неизвестный тип объекта в pack-файле: {kind}")
+
+        return base[0], apply_git_delta(base[1], _inflate_at(f, offset + pos))
+
+
+class GitRepository:
+    def __init__(self, git_dir):
+        self.git_dir = Path(git_dir)
+        try:
+            common = (self.git_dir / "commondir").read_text(encoding='utf-8').strip()
+            self.common_dir = self.git_dir / common
+        except OSError:
+            self.common_dir = self.git_dir
+        self.objects_dir = self.common_dir / "objects"
+        self.hash_size = git_hash_size(self.common_dir)
+        self._packs = None
+        self._packed_refs = None
+
+    def packs(self):
+        if self._packs is None:
+            self._packs = []
+            for idx_path in sorted((self.objects_dir / "pack").glob("*.idx")):
+                try:
+                    self._packs.append(_GitPack(idx_path, self.hash_size))
+                except (OSError, ValueError, struct.error):
+                    continue
+        return self._packs
+
+    def read_object(self, name):
+        try:
+            with open(self.objects_dir / name[:2] / name[2:], 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            pass
+        else:
+            header, _, data = raw.partition(b'\0')
+            return header.split(b' ')[0].decode('ascii'), data
+
+        for pack in self.packs():
+            offset = pack.offset(name)
+            if offset is not None:
+                return pack.read(offset, self)
+        raise KeyError(name)
+
+    def read_ref(self, name):
+        for base in (self.git_dir, self.common_dir):
+            try:
+                value = (base / name).read_text(encoding='utf-8').strip()
+            except OSError:
+                continue
+            if value.startswith("ref:"):
+                return self.read_ref(value[len("ref:"):].strip())
+            return value
+
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            try:
+                with open(self.common_dir / "packed-refs", 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith(('#', '^')):
+                            continue
+                        value, _, ref = line.strip().partition(' ')
+                        self._packed_refs[ref] = value
+            except OSError:
+                pass
+        return self._packed_refs.get(name)
+
+    def resolve(self, rev):
+        found = re.fullmatch(r'(.+?)((?:[~^]\d*)*)', rev.strip())
+        if found is None:
+            raise ValueError(f"пустая ревизия: {rev!r}")
+
+        name = self.peel(self._resolve_name(found.group(1)))
+        for op, count in re.findall(r'([~^])(\d*)', found.group(2)):
+            count = int(count) if count else 1
+            if op == '~':
+                for _ in range(count):
+                    name = self._parent(name, 1)
+            elif count:
+                name = self._parent(name, count)
+        return name
+
+    def _resolve_name(self, name):
+        hex_name = name.lower()
+        if re.fullmatch('[0-9a-f]{%d}' % (self.hash_size * 2), hex_name):
+            return hex_name
+
+        for ref in (name, f"refs/{name}", f"refs/tags/{name}", f"refs/heads/{name}", f"refs/remotes/{name}",
+                    f"refs/remotes/{name}/HEAD"):
+            value = self.read_ref(ref)
+            if value:
+                return value
+
+        if re.fullmatch('[0-9a-f]{4,}', hex_name):
+            candidates = set()
+            try:
+                candidates.update(hex_name[:2] + entry for entry in os.listdir(self.objects_dir / hex_name[:2])
+                                  if entry.startswith(hex_name[2:]))
+            except OSError:
+                pass
+            for pack in self.packs():
+                candidates.update(pack.find_prefix(hex_name))
+            if len(candidates) == 1:
+                return candidates.pop()
+            if candidates:
+                raise ValueError(f"неоднозначный префикс хеша: {name}")
+        raise ValueError(f"ревизия не найдена: {name}")
+
+    def peel(self, name):
+        kind, data = self.read_object(name)
+        while kind == "tag":
+            name = data.split(b'\n', 1)[0].split(b' ')[1].decode('ascii')
+            kind, data = self.read_object(name)
+        if kind != "commit":
+            raise ValueError(f"{name} не является коммитом")
+        return name
+
+    def commit_fields(self, name):
+        kind, data = self.read_object(name)
+        if kind != "commit":
+            raise ValueError(f"{name} не является коммитом")
+
+        fields = {"parent": []}
+        for line in data.split(b'\n'):
+            if not line:
+                break
+            key, _, value = line.decode('utf-8', 'replace').partition(' ')
+            if key == "parent":
+                fields["parent"].append(value)
+            elif key == "tree":
+                fields["tree"] = value
+        return fields
+
+    def _parent(self, name, number):
+        parents = self.commit_fields(name)["parent"]
+        if number > len(parents):
+            raise ValueError(f"у коммита {name[:12]} нет родителя {number}")
+        return parents[number - 1]
+
+    def tree_entries(self, tree):
+        kind, data = self.read_object(tree)
+        if kind != "tree":
+            raise ValueError(f"{tree} не является деревом")
+
+        entries = []
+        pos = 0
+        while pos < len(data):
+            space = data.index(b' ', pos)
+            nul = data.index(b'\0', space)
+            entries.append((os.fsdecode(data[space + 1:nul]), int(data[pos:space], 8),
+                            data[nul + 1:nul + 1 + self.hash_size].hex()))
+            pos = nul + 1 + self.hash_size
+        return entries
+
+    def subtree(self, commit, names):
+        tree = self.commit_fields(commit)["tree"]
+        for name in names:
+            tree = next((sha for entry_name, mode, sha in self.tree_entries(tree)
+                         if entry_name == name and mode == 0o40000), None)
+            if tree is None:
+                return None
+        return tree
+
+    def walk_tree(self, tree, prune=None, names=()):
+        for name, mode, sha in self.tree_entries(tree):
+            path = names + (name,)
+            if mode == 0o40000:
+                if prune is None or not prune(path):
+                    yield from self.walk_tree(sha, prune, path)
+            elif mode >> 12 == 0o10:
+                yield path, sha
+
+
+class ManifestReference:
+    def __init__(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.label = str(path)
+        self.commit = None
+        self.entries = {entry["path"]: entry for entry in manifest.get("files", [])}
+
+    def paths(self):
+        return list(self.entries)
+
+    def compare(self, file_path, full_path):
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return "added"
+
+        with open(full_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if entry["size"] != st.st_size:
+                return "modified"
+            if entry["mtime_ns"] == st.st_mtime_ns:
+                return None
+
+            digest = hashlib.sha1()
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return None if digest.hexdigest() == entry["hash"] else "modified"
+
+
+class GitReference:
+    def __init__(self, label, commit, blobs, index, index_mtime_ns, hash_size):
+        self.label = label
+        self.commit = commit
+        self.blobs = blobs
+        self.index = index
+        self.index_mtime_ns = index_mtime_ns
+        self.hash_size = hash_size
+
+    def paths(self):
+        return list(self.blobs)
+
+    def compare(self, file_path, full_path):
+        blob = self.blobs.get(file_path)
+        if blob is None:
+            return "added"
+
+        with open(full_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            cached = self.index.get(file_path)
+            if cached is not None and cached[2] == blob:
+                if cached[0] != st.st_size:
+                    return "modified"
+                if cached[1] == st.st_mtime_ns < self.index_mtime_ns:
+                    return None
+            return None if git_blob_hash(f, self.hash_size) == blob else "modified"
+
+
+class Stats:
+    def __init__(self, progress=False, slowest=10):
+        self.started = time.perf_counter()
+        self.phases = Counter()
+        self.counters = Counter()
+        self.excluded_by = Counter()
+        self.file_times = []
+        self.slowest = slowest
+        self.progress = progress
+        self._progress_at = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def timed(self, func):
+        def wrapper(file_path):
+            start = time.perf_counter()
+            try:
+                return func(file_path)
+            finally:
+                self.file_times.append((time.perf_counter() - start, file_path))
+        return wrapper
+
+    def show_progress(self, message, done=False):
+        if not self.progress:
+            return
+
+        now = time.perf_counter()
+        if done or now - self._progress_at >= 0.1:
+            self._progress_at = now
+            sys.stderr.write(f"\r\033[K{message}" + ("\n" if done else ""))
+            sys.stderr.flush()
+
+    def to_dict(self):
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "read_decode_seconds": round(sum(seconds for seconds, _ in self.file_times), 4),
+            "counters": dict(self.counters),
+            "excluded_by_pattern": dict(self.excluded_by.most_common()),
+            "slowest_files": [
+                {"path": file_path, "seconds": round(seconds, 4)}
+                for seconds, file_path in heapq.nlargest(self.slowest, self.file_times)
+            ],
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+class _StatsWriter:
+    def __init__(self, f, stats):
+        self.f = f
+        self.stats = stats
+
+    def write(self, data):
+        start = time.perf_counter()
+        written = self.f.write(data)
+        self.stats.phases["write"] += time.perf_counter() - start
+        self.stats.counters["bytes_written"] += len(data)
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+class FileIndex:
+    def __init__(self, files=(), fingerprint=None, dirs=None):
+        self.fingerprint = fingerprint
+        self.dirs = dirs or {}
+        self.files = []
+        self.by_name = {}
+        self.by_stem = {}
+        self.by_suffix = {}
+        self._globs = {}
+        for file_path in files:
+            self.add(file_path)
+
+    @staticmethod
+    def _key(value):
+        return os.path.normcase(value.replace('\\', '/'))
+
+    def add(self, file_path):
+        index = len(self.files)
+        self.files.append(file_path)
+
+        parts = self._key(file_path).split('/')
+        name = parts[-1]
+        self.by_name.setdefault(name, []).append(index)
+
+        stem = os.path.splitext(name)[0]
+        if stem and stem != name:
+            self.by_stem.setdefault(stem, []).append(index)
+        if len(parts) > 1:
+            self.by_suffix.setdefault(parts[-2] + '/' + name, []).append(index)
+
+    def find(self, pattern):
+        key = self._key(pattern.strip())
+        if key.startswith('./'):
+            key = key[2:]
+
+        if any(char in key for char in '*?['):
+            indices = self._find_glob(key)
+        elif '/' in key:
+            candidates = self.by_suffix.get('/'.join(key.split('/')[-2:]), [])
+            indices = [i for i in candidates if ('/' + self._key(self.files[i])).endswith('/' + key)]
+        else:
+            indices = self.by_name.get(key, []) + self.by_stem.get(key, [])
+
+        return [self.files[i] for i in sorted(set(indices))]
+
+    def _find_glob(self, key):
+        match = self._globs.get(key)
+        if match is None:
+            prefix = '(?s:.*/)?' if '/' in key else ''
+            match = self._globs[key] = re.compile(prefix + fnmatch.translate(key)).match
+
+        if '/' in key:
+            indices = []
+            for i, file_path in enumerate(self.files):
+                path_key = self._key(file_path)
+                if match(path_key[2:] if path_key.startswith('./') else path_key):
+                    indices.append(i)
+            return indices
+
+        return [i for name, name_indices in self.by_name.items() if match(name) for i in name_indices]
+
+    def to_dict(self):
+        return {"fingerprint": self.fingerprint, "files": self.files, "dirs": self.dirs}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("files", []), data.get("fingerprint"), data.get("dirs"))
+
+
+def trigrams(data):
+    data = data.lower()
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _literal_trigrams(text, ignore_case):
+    grams = trigrams(text.encode('utf-8'))
+    if ignore_case:
+        # k и s без учета регистра совпадают и с не-ASCII символами (K, ſ)
+        grams = {gram for gram in grams if max(gram) < 0x80 and b'k' not in gram and b's' not in gram}
+    return grams
+
+
+def _required_literals(items):
+    required = []
+    run = []
+
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+
+        if run:
+            required.append(''.join(run))
+            run = []
+
+        if op is sre_parse.SUBPATTERN and value[1] & re.IGNORECASE:
+            continue
+        if op is sre_parse.SUBPATTERN:
+            inner = _required_literals(value[-1])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            inner = _required_literals(value[2])
+        elif op is sre_parse.BRANCH and len(items) == 1:
+            return [alternative for branch in value[1] for alternative in _required_literals(branch)]
+        else:
+            continue
+        if len(inner) == 1:
+            required.extend(inner[0])
+
+    if run:
+        required.append(''.join(run))
+    return [required]
+
+
+def query_trigrams(query, regex=False, ignore_case=False):
+    if not regex:
+        return [_literal_trigrams(query, ignore_case)]
+
+    try:
+        parsed = sre_parse.parse(query)
+    except Exception:
+        return None
+
+    ignore_case = ignore_case or bool(parsed.state.flags & re.IGNORECASE)
+    alternatives = []
+    for literals in _required_literals(list(parsed)):
+        grams = set()
+        for literal in literals:
+            grams |= _literal_trigrams(literal, ignore_case)
+        if not grams:
+            return None
+        alternatives.append(grams)
+    return alternatives
+
+
+class ContentIndex:
+    MAGIC = b"PPTRI1\n"
+    _HEADER = struct.Struct('<I')
+    _POSTING = struct.Struct('<3sI')
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = None
+        self.ids = {}
+        self.postings = {}
+        self.unindexed = set()
+        self.dead = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.files is not None:
+            return
+
+        self.files = []
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(self.MAGIC):
+                return
+
+            pos = len(self.MAGIC)
+            header_size, = self._HEADER.unpack_from(data, pos)
+            pos += self._HEADER.size
+            header = json.loads(data[pos:pos + header_size].decode('utf-8'))
+            pos += header_size
+            if header.get("byteorder") != sys.byteorder:
+                return
+
+            postings = {}
+            view = memoryview(data)
+            while pos < len(data):
+                gram, count = self._POSTING.unpack_from(data, pos)
+                pos += self._POSTING.size
+                ids = array('I')
+                ids.frombytes(view[pos:pos + count * ids.itemsize])
+                pos += count * ids.itemsize
+                postings[gram] = ids
+        except (OSError, ValueError, struct.error):
+            return
+
+        self.files = header["files"]
+        self.ids = {entry[0]: i for i, entry in enumerate(self.files) if entry is not None}
+        self.unindexed = set(header.get("unindexed", []))
+        self.dead = len(self.files) - len(self.ids)
+        self.postings = postings
+
+    def fresh(self, file_path, st):
+        file_id = self.ids.get(file_path)
+        if file_id is None:
+            return False
+        entry = self.files[file_id]
+        return entry[1] == st.st_size and entry[2] == st.st_mtime_ns
+
+    def add(self, file_path, st, data):
+        grams = trigrams(data) if data is not None else None
+        with self.lock:
+            self._drop(file_path)
+            file_id = len(self.files)
+            self.files.append([file_path, st.st_size, st.st_mtime_ns])
+            self.ids[file_path] = file_id
+            if grams is None:
+                self.unindexed.add(file_id)
+            else:
+                for gram in grams:
+                    ids = self.postings.get(gram)
+                    if ids is None:
+                        ids = self.postings[gram] = array('I')
+                    ids.append(file_id)
+            self.dirty = True
+
+    def retain(self, file_paths):
+        keep = set(file_paths)
+        with self.lock:
+            for file_path in [path for path in self.ids if path not in keep]:
+                self._drop(file_path)
+
+    def _drop(self, file_path):
+        file_id = self.ids.pop(file_path, None)
+        if file_id is not None:
+            self.files[file_id] = None
+            self.unindexed.discard(file_id)
+            self.dead += 1
+            self.dirty = True
+
+    def candidates(self, alternatives):
+        if alternatives is None:
+            return None
+
+        found = set()
+        for grams in alternatives:
+            if not grams:
+                return None
+            lists = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+            ids = set(lists[0])
+            for other in lists[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(other)
+            found |= ids
+
+        found |= self.unindexed
+        return {self.files[i][0] for i in found if self.files[i] is not None}
+
+    def compact(self):
+        live = [i for i, entry in enumerate(self.files) if entry is not None]
+        remap = {old: new for new, old in enumerate(live)}
+        postings = {}
+        for gram, ids in self.postings.items():
+            kept = array('I', (remap[i] for i in ids if i in remap))
+            if kept:
+                postings[gram] = kept
+
+        self.files = [self.files[i] for i in live]
+        self.ids = {entry[0]: i for i, entry in enumerate(self.files)}
+        self.unindexed = {remap[i] for i in self.unindexed}
+        self.postings = postings
+        self.dead = 0
+        self.dirty = True
+
+    def save(self):
+        if self.files is None or not self.dirty:
+            return
+        if self.dead > max(1000, len(self.ids)):
+            self.compact()
+
+        header = json.dumps({"byteorder": sys.byteorder, "files": self.files,
+                             "unindexed": sorted(self.unindexed)}, ensure_ascii=False).encode('utf-8')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = str(self.path) + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(self._HEADER.pack(len(header)))
+            f.write(header)
+            for gram, ids in self.postings.items():
+                f.write(self._POSTING.pack(gram, len(ids)))
+                f.write(ids.tobytes())
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+
+def _entry_is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _entry_sort_key(entry):
+    return entry.name.lower(), entry.name
+
+
+def _copy_range(src_f, dst_f, offset, length, chunk_size=STREAM_CHUNK_SIZE):
+    src_f.seek(offset)
+    while length > 0:
+        chunk = src_f.read(min(chunk_size, length))
+        if not chunk:
+            raise IOError("Неожиданный конец файла при копировании")
+        dst_f.write(chunk)
+        length -= len(chunk)
+
+
+def _stream_decodes(f, encoding):
+    f.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            decoder.decode(chunk, not chunk)
+            if not chunk:
+                return True
+    except UnicodeDecodeError:
+        return False
+
+
+class _StreamedSegment:
+    def __init__(self, file_path, header, encoding, raw_copy):
+        self.file_path = file_path
+        self.header = header
+        self.encoding = encoding
+        self.raw_copy = raw_copy
+
+    def write_to(self, out_f):
+        out_f.write(self.header)
+        written = len(self.header)
+        last = b''
+
+        with open(self.file_path, 'rb') as f:
+            if self.raw_copy:
+                while True:
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out_f.write(chunk)
+                    written += len(chunk)
+                    last = chunk[-1:]
+            else:
+                for body in self._normalized_chunks(f):
+                    out_f.write(body)
+                    written += len(body)
+                    last = body[-1:]
+
+        tail = b'\n\n' if last and last != b'\n' else b'\n'
+        out_f.write(tail)
+        return written + len(tail)
+
+    def _normalized_chunks(self, f):
+        if self.encoding == 'utf-8':
+            carry = b''
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                data = carry + chunk
+                carry = b''
+                if chunk:
+                    for partial in _RAW_PARTIAL_BREAKS:
+                        if data.endswith(partial):
+                            data, carry = data[:-len(partial)], partial
+                            break
+
+                body = normalize_utf8_newlines(data)
+                if body:
+                    yield body
+                if not chunk:
+                    return
+
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        carry = ''
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            text = carry + decoder.decode(chunk, not chunk)
+            carry = ''
+            if chunk and text.endswith('\r'):
+                text, carry = text[:-1], '\r'
+
+            body = normalize_newlines(text).encode('utf-8')
+            if body:
+                yield body
+            if not chunk:
+                return
+
+
+def new_compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "xz":
+        if lzma is None:
+            raise ValueError("модуль lzma недоступен в этой сборке Python")
+        return lzma.LZMACompressor(lzma.FORMAT_XZ)
+    raise ValueError(f"неизвестный формат сжатия: {compression}")
+
+
+def decompress_member(data, compression):
+    if compression == "gzip":
+        return zlib.decompress(data, 31)
+    if compression == "xz":
+        if lzma is None:
+            raise ValueError("модуль lzma недоступен в этой сборке Python")
+        return lzma.decompress(data, lzma.FORMAT_XZ)
+    return data
+
+
+def bundle_index_path(bundle_path):
+    return str(bundle_path) + ".idx"
+
+
+class _CompressedMember:
+    def __init__(self, out_f, compression):
+        self.out_f = out_f
+        self.compressor = new_compressor(compression)
+        self.length = 0
+
+    def write(self, data):
+        self._emit(self.compressor.compress(data))
+
+    def finish(self):
+        self._emit(self.compressor.flush())
+        return self.length
+
+    def _emit(self, chunk):
+        if chunk:
+            self.out_f.write(chunk)
+            self.length += len(chunk)
+
+
+class BundleReader:
+    def __init__(self, bundle_path, index_path=None):
+        self.bundle_path = str(bundle_path)
+        with open(index_path or bundle_index_path(bundle_path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+
+        self.compression = index.get("compression")
+        self.entries = {entry["path"]: entry for entry in index["files"]}
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def paths(self):
+        return list(self.entries)
+
+    def entry(self, path):
+        key = path.replace('\\', '/')
+        for candidate in (path, key, "./" + key, os.path.join(".", *key.split('/'))):
+            if candidate in self.entries:
+                return self.entries[candidate]
+        raise KeyError(path)
+
+    def read(self, path):
+        return self.read_range(path)
+
+    def read_text(self, path):
+        return self.read(path).decode('utf-8')
+
+    def read_segment(self, path):
+        entry = self.entry(path)
+        return decompress_member(self._read_at(entry["offset"], entry["length"]), self.compression)
+
+    def read_range(self, path, start=0, length=None):
+        entry = self.entry(path)
+        while "duplicate_of" in entry:
+            entry = self.entries[entry["duplicate_of"]]
+        start = min(max(start, 0), entry["content_length"])
+        end = entry["content_length"] if length is None else min(start + length, entry["content_length"])
+
+        if self.compression is None:
+            return self._read_at(entry["offset"] + entry["content_offset"] + start, end - start)
+
+        segment = self.read_segment(entry["path"])
+        offset = entry["content_offset"]
+        return segment[offset + start:offset + end]
+
+    def _read_at(self, offset, length):
+        if self._file is None:
+            self._file = open(self.bundle_path, 'rb')
+        self._file.seek(offset)
+        return self._file.read(length)
+
+
+_INOTIFY_EVENT = struct.Struct('iIII')
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+
+
+class InotifyWatcher:
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            | IN_ONLYDIR)
+
+    def __init__(self):
+        if ctypes is None or not sys.platform.startswith("linux"):
+            raise OSError("inotify доступен только в Linux")
+
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.paths = {}
+        self.wds = {}
+
+    def add(self, path):
+        if path in self.wds:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno in (2, 20):
+                return
+            raise OSError(errno, os.strerror(errno), path)
+        self.wds[path] = wd
+        self.paths[wd] = path
+
+    def remove(self, path):
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def poll(self, timeout=None):
+        if not self.selector.select(timeout):
+            return []
+
+        data = os.read(self.fd, 256 * 1024)
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, pos)
+            name = data[pos + _INOTIFY_EVENT.size:pos + _INOTIFY_EVENT.size + length].rstrip(b'\0')
+            pos += _INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(None)
+            elif mask & IN_IGNORED:
+                path = self.paths.pop(wd, None)
+                if path is not None and self.wds.get(path) == wd:
+                    del self.wds[path]
+            elif name and wd in self.paths:
+                events.append((self.paths[wd], os.fsdecode(name)))
+        return events
+
+    def close(self):
+        self.selector.close()
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.snapshots = {}
+
+    @staticmethod
+    def snapshot(path):
+        entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            entries[entry.name] = None
+                        else:
+                            st = entry.stat()
+                            entries[entry.name] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return entries
+
+    def add(self, path):
+        if path not in self.snapshots:
+            self.snapshots[path] = self.snapshot(path)
+
+    def remove(self, path):
+        self.snapshots.pop(path, None)
+
+    def poll(self, timeout=None):
+        while True:
+            time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+
+            events = []
+            for path, old in list(self.snapshots.items()):
+                new = self.snapshot(path)
+                if new != old:
+                    self.snapshots[path] = new
+                    events.extend((path, name) for name in old.keys() | new.keys()
+                                  if old.get(name, False) != new.get(name, False))
+            if events or timeout is not None:
+                return events
+
+    def close(self):
+        self.snapshots.clear()
+
 
 class PyParser:
-    def __init__(self):
-        self.config_file = Path("pyparser_config.json")
-        self.output_files = ["code.txt", "choosen_code.txt", "structure.txt"]
+    def __init__(self, root=".", config=None, verbose=True):
+        self.root = str(root)
+        root_path = Path(self.root)
+        self.config_file = root_path / "pyparser_config.json"
+        self.manifest_file = root_path / "pyparser_manifest.json"
+        self.cache_dir = root_path / ".pyparser_cache"
+        bundles = [name + suffix for suffix in ("", *COMPRESSION_SUFFIXES.values())
+                   for name in ("code.txt", "choosen_code.txt", "delta.txt")]
+        self.output_files = (bundles + ["structure.txt"] + [bundle_index_path(name) for name in bundles]
+                             + ["code.shards.json", SHARD_FILES_GLOB])
+        self.system_files = ["pyparser.py", "pyparser_config.json", "pyparser_manifest.json",
+                             ".pyparser_cache"] + self.output_files
+        self.verbose = verbose
+        self.stats = None
+        self.extra_excluded = []
+        self.encoding_cache = EncodingCache(self.cache_dir / "encodings.json")
+        self.outline_cache = OutlineCache(self.cache_dir / "outlines.json")
+        self.content_index = ContentIndex(self.cache_dir / "trigrams.bin")
+        self._process_pools = {}
+        self._process_lock = threading.Lock()
+        self._config = self.merge_config(config) if config is not None else None
+        self._exclusion_matcher = None
+        self._file_index = None
+        self._file_index_fresh = False
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = self.load_config()
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+        self._exclusion_matcher = None
+
+    @property
+    def exclusion_matcher(self):
+        if self._exclusion_matcher is None:
+            self.compile_exclusions()
+        return self._exclusion_matcher
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def run_interactive(self):
         self.config = self.init_config()
         self.ensure_gitignore()
         self.main_loop()
 
-    def init_config(self):
-        default_config = {
-            "excluded": [".venv", "__pycache__", ".git", "pyparser.py", "pyparser_config.json"] + self.output_files,
+    def default_config(self):
+        return {
+            "excluded": [".venv", "__pycache__", ".git"] + self.system_files,
             "file_types": [".py", ".html", ".css", ".js", ".json", ".txt", ".md"],
-            "auto_gitignore": True
+            "auto_gitignore": True,
+            "read_workers": 0,
+            "read_window": 64,
+            "stream_threshold": 1024 * 1024,
+            "persist_file_index": False,
+            "max_file_size": 50 * 1024 * 1024,
+            "max_size_by_type": {},
+            "skip_binary": True,
+            "use_gitignore": False,
+            "file_source": "walk",
+            "compression": None,
+            "dedup": False,
+            "walk_workers": 0,
+            "outline": False,
+            "outline_workers": 0,
+            "shard_size": 0,
+            "shard_tokens": 0,
+            "shard_writers": 4,
+            "content_index": False,
+            "structure_depth": 0,
+            "structure_entries": 0,
+            "structure_sizes": False,
+            "structure_lines": False,
+            "strip": False,
+            "strip_workers": 0
         }
 
+    def merge_config(self, config):
+        config.setdefault("excluded", [])
+        for sys_file in self.system_files:
+            if sys_file not in config["excluded"]:
+                config["excluded"].append(sys_file)
+        for key, value in self.default_config().items():
+            config.setdefault(key, value)
+        return config
+
+    def load_config(self):
+        if self.config_file.exists():
+            try:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    return self.merge_config(json.load(f))
+            except json.JSONDecodeError:
+                self.log("Ошибка чтения конфига, используются значения по умолчанию")
+        return self.default_config()
+
+    def init_config(self):
+        default_config = self.default_config()
+
         if self.config_file.exists():
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    system_files = ["pyparser.py", "pyparser_config.json"] + self.output_files
-                    for sys_file in system_files:
-                        if sys_file not in config.get("excluded", []):
-                            config["excluded"].append(sys_file)
-                    if "file_types" not in config:
-                        config["file_types"] = default_config["file_types"]
-                    return config
+                    return self.merge_config(json.load(f))
             except json.JSONDecodeError:
                 print("Ошибка чтения конфига, создан новый")
                 return self.create_config(default_config)
         else:
             return self.create_config(default_config)
 
+    def apply_overrides(self, excluded=None, file_types=None, **overrides):
+        known = self.default_config()
+        for key, value in overrides.items():
+            if key not in known:
+                raise TypeError(f"Неизвестная настройка: {key}")
+            if value is None:
+                continue
+            if key == "compression" and value == "none":
+                value = None
+            self.config[key] = value
+        if excluded:
+            for item in excluded:
+                item = item.replace('\\', '/')
+                if item not in self.config["excluded"]:
+                    self.config["excluded"].append(item)
+        if file_types:
+            self.config["file_types"] = [ext if ext.startswith('.') else '.' + ext for ext in file_types]
+        self._exclusion_matcher = None
+
+    def bundle_name(self, name):
+        return name + COMPRESSION_SUFFIXES.get(self.config.get("compression"), "")
+
+    def shard_budget(self):
+        budgets = [budget for budget in (self.config.get("shard_size", 0) or 0,
+                                         (self.config.get("shard_tokens", 0) or 0) * BYTES_PER_TOKEN) if budget]
+        return min(budgets) if budgets else None
+
+    def shard_path(self, output_file, number):
+        suffix = COMPRESSION_SUFFIXES.get(self.config.get("compression"), "")
+        if suffix and output_file.endswith(suffix):
+            output_file = output_file[:-len(suffix)]
+        stem, ext = os.path.splitext(output_file)
+        return f"{stem}.{number:03d}{ext}{suffix}"
+
+    def shards_manifest_path(self, output_file):
+        return self.shard_path(output_file, 0).rsplit(".000", 1)[0] + ".shards.json"
+
+    def exclude_shards(self, output_file):
+        manifest_path = self.shards_manifest_path(output_file)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                shards = json.load(f).get("shards", [])
+        except (OSError, ValueError):
+            return []
+
+        directory = os.path.dirname(manifest_path)
+        paths = [os.path.join(directory, shard["path"]) for shard in shards]
+        for path in paths:
+            self.exclude_output(path)
+            self.exclude_output(bundle_index_path(path))
+        self.exclude_output(manifest_path)
+        return paths
+
+    def output_path(self, name):
+        if self.root in ("", "."):
+            return name
+        return os.path.join(self.root, name)
+
+    def fs_path(self, file_path):
+        if self.root in ("", ".") or os.path.isabs(file_path):
+            return file_path
+        return os.path.join(self.root, file_path)
+
+    def exclude_output(self, output_file):
+        output_abs = os.path.abspath(output_file)
+        if output_abs not in self.extra_excluded:
+            self.extra_excluded.append(output_abs)
+            self._exclusion_matcher = None
+
     def create_config(self, config):
         with open(self.config_file, 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=2, ensure_ascii=False)
@@ -47,8 +2055,9 @@ class PyParser:
         if not self.config.get("auto_gitignore", True):
             return
 
-        gitignore_path = Path(".gitignore")
-        entries_to_add = self.output_files + ["pyparser_config.json", "pyparser.py"]
+        gitignore_path = Path(self.root) / ".gitignore"
+        entries_to_add = self.output_files + [".pyparser_cache/", "pyparser_manifest.json", "pyparser_config.json",
+                                              "pyparser.py"]
 
         if not gitignore_path.exists():
             with open(gitignore_path, 'w', encoding='utf-8') as f:
@@ -104,158 +2113,1132 @@ class PyParser:
                 f.truncate()
                 print(f"Обновлен {gitignore_path}")
 
+    def phase(self, name):
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.phase(name)
+
+    def gitignore_chain(self, root_dir):
+        if not self.config.get("use_gitignore", False):
+            return None
+
+        root_abs = Path(root_dir).absolute()
+        found = find_git_dir(root_abs)
+        rules = []
+
+        if found is not None:
+            top, git_dir = found
+            prefix = root_abs.relative_to(top).as_posix()
+            prefix = "" if prefix == "." else prefix + "/"
+            rules.append(GitIgnore.load(git_dir / "info" / "exclude", prepend=prefix))
+
+            for directory in reversed(list(root_abs.parents)[:len(root_abs.relative_to(top).parts)]):
+                rules.append(GitIgnore.load(directory / ".gitignore",
+                                            prepend=root_abs.relative_to(directory).as_posix() + "/"))
+
+        rules.append(GitIgnore.load(root_abs / ".gitignore"))
+        return GitIgnoreChain(tuple(ignore for ignore in rules if ignore))
+
+    @staticmethod
+    def _child_ignore(ignore, entry):
+        if ignore is None:
+            return None
+        return ignore.child(entry.name, entry.path)
+
+    def compile_exclusions(self):
+        patterns = self.config.get("excluded", []) + self.extra_excluded
+        self._exclusion_matcher = ExclusionMatcher(patterns, self.root)
+
     def should_exclude(self, path):
-        if isinstance(path, str):
-            path_obj = Path(path)
+        return self.exclusion_matcher.match_path(path)
+
+    def find_files_by_types(self, root_dir=None, file_types=None, skipped=None, visited=None):
+        counts = {"excluded": 0, "visited": visited}
+        with self.phase("walk"):
+            files = list(self.iter_files_by_types(root_dir, file_types, skipped, counts))
+
+        if self.stats is not None:
+            self.stats.show_progress(f"Обход: {self.stats.counters['dirs_visited']} папок, {len(files)} файлов",
+                                     done=True)
+        return files, counts["excluded"]
+
+    def iter_files_by_types(self, root_dir=None, file_types=None, skipped=None, counts=None):
+        if file_types is None:
+            file_types = self.config.get("file_types", [".py"])
+        if counts is None:
+            counts = {"excluded": 0}
+
+        extensions = tuple(ext.lower() for ext in file_types)
+        size_limits = self.size_limits()
+
+        if root_dir is None and self.config.get("file_source", "walk") == "git":
+            with self.phase("git_index"):
+                result = self.find_files_in_git_index(extensions, size_limits, skipped)
+            if result is not None:
+                counts["excluded"] += result[1]
+                if counts.get("visited") is not None:
+                    counts["visited"].append(str(find_git_dir(self.root)[1] / "index"))
+                yield from result[0]
+                return
+            self.log("Индекс git не найден, используется обход папок")
+
+        found = 0
+        visited = counts.get("visited")
+        for path, parts, dirs, file_entries, excluded in self.walk_project(root_dir, extensions):
+            counts["excluded"] += len(excluded)
+            if visited is not None:
+                visited.append(path)
+            files = []
+            self._add_files(files, path, file_entries, size_limits, skipped)
+            found += len(files)
+            if self.stats is not None:
+                self.stats.show_progress(f"Обход: {self.stats.counters['dirs_visited']} папок, {found} файлов")
+            yield from files
+
+    def find_files_in_git_index(self, extensions, size_limits=None, skipped=None):
+        found = find_git_dir(self.root)
+        if found is None:
+            return None
+
+        top, git_dir = found
+        try:
+            entries = read_git_index(git_dir / "index", git_hash_size(git_dir))
+        except (OSError, ValueError, struct.error) as e:
+            self.log(f"Не удалось прочитать индекс git: {e}")
+            return None
+
+        prefix = Path(self.root).absolute().relative_to(top).as_posix()
+        prefix = "" if prefix == "." else prefix + "/"
+        matcher = self.exclusion_matcher
+        excluded_dirs = {(): False}
+        excluded_count = 0
+        selected = []
+
+        for path, size, _, _ in entries:
+            if not path.startswith(prefix) or not path.lower().endswith(extensions):
+                continue
+
+            names = path[len(prefix):].split('/')
+            parts = tuple(name.lower() for name in names)
+
+            excluded = False
+            for depth in range(1, len(parts)):
+                key = parts[:depth]
+                excluded = excluded_dirs.get(key)
+                if excluded is None:
+                    excluded = excluded_dirs[key] = matcher.match(key)
+                    excluded_count += excluded
+                if excluded:
+                    break
+            if excluded:
+                continue
+            if matcher.match(parts):
+                excluded_count += 1
+                continue
+
+            file_path = os.path.join(".", *names)
+            reason = self.size_limit_reason(names[-1], size, size_limits) if size_limits is not None else None
+            if reason is None:
+                selected.append((_index_sort_key(names), file_path))
+            elif skipped is not None:
+                skipped.append((file_path, reason))
+
+        if self.stats is not None:
+            self.stats.counters["index_entries"] += len(entries)
+        selected.sort()
+        return [file_path for _, file_path in selected], excluded_count
+
+    def size_limits(self):
+        by_type = {ext.lower(): limit for ext, limit in self.config.get("max_size_by_type", {}).items() if limit}
+        global_limit = self.config.get("max_file_size", 0) or 0
+        if not by_type and not global_limit:
+            return None
+        return global_limit, by_type
+
+    def size_limit_reason(self, name, size, size_limits):
+        global_limit, by_type = size_limits
+        limit = by_type.get(os.path.splitext(name)[1].lower(), global_limit)
+        if limit and size > limit:
+            return f"размер {format_size(size)} больше лимита {format_size(limit)}"
+        return None
+
+    def _add_files(self, files, path, file_entries, size_limits, skipped):
+        if size_limits is None:
+            files.extend(os.path.join(path, entry.name) for entry in file_entries)
+            return
+
+        if self.stats is not None:
+            self.stats.counters["stat_calls"] += len(file_entries)
+
+        for entry in file_entries:
+            file_path = os.path.join(path, entry.name)
+            try:
+                reason = self.size_limit_reason(entry.name, entry.stat().st_size, size_limits)
+            except OSError:
+                reason = None
+
+            if reason is None:
+                files.append(file_path)
+            elif skipped is not None:
+                skipped.append((file_path, reason))
+
+    def walk_project(self, root_dir=None, extensions=None):
+        if root_dir is None:
+            root_dir, display_root = self.root, "."
         else:
-            path_obj = path
+            display_root = root_dir
+
+        workers = self.config.get("walk_workers", 0) or 0
+        if workers > 1:
+            yield from self._walk_parallel(root_dir, display_root, extensions, workers)
+            return
+
+        stack = [(root_dir, display_root, self.exclusion_matcher.parts_of(root_dir), self.gitignore_chain(root_dir))]
+
+        while stack:
+            path, display_path, parts, ignore = stack.pop()
+            try:
+                dirs, files, excluded = self.scan_directory(path, parts, extensions, ignore)
+            except OSError:
+                continue
+
+            yield display_path, parts, dirs, files, excluded
+
+            for entry in reversed(dirs):
+                if not entry.is_symlink():
+                    stack.append((entry.path, os.path.join(display_path, entry.name),
+                                  self._child_parts(parts, entry.name), self._child_ignore(ignore, entry)))
+
+    def _walk_parallel(self, root_dir, display_root, extensions, workers):
+        cancelled = False
 
+        def scan(path, parts, ignore):
+            if cancelled:
+                return None
+            try:
+                dirs, files, excluded = self._scan_entries(path, parts, extensions, ignore)
+            except OSError:
+                return None
+
+            children = []
+            for entry in dirs:
+                if not entry.is_symlink():
+                    child_parts = self._child_parts(parts, entry.name)
+                    child_ignore = self._child_ignore(ignore, entry)
+                    children.append((entry.name, child_parts,
+                                     executor.submit(scan, entry.path, child_parts, child_ignore)))
+            return dirs, files, excluded, children
+
+        executor = ThreadPoolExecutor(max_workers=workers)
         try:
-            abs_path = path_obj.absolute()
-        except:
-            return False
+            root_parts = self.exclusion_matcher.parts_of(root_dir)
+            stack = [(display_root, root_parts,
+                      executor.submit(scan, root_dir, root_parts, self.gitignore_chain(root_dir)))]
+
+            while stack:
+                display_path, parts, future = stack.pop()
+                result = future.result()
+                if result is None:
+                    continue
+
+                dirs, files, excluded, children = result
+                if self.stats is not None:
+                    self._count_scan(parts, dirs, files, excluded)
+                yield display_path, parts, dirs, files, excluded
+
+                for name, child_parts, child in reversed(children):
+                    stack.append((os.path.join(display_path, name), child_parts, child))
+        finally:
+            cancelled = True
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def scan_directory(self, path, parts, extensions=None, ignore=None):
+        dirs, files, excluded = self._scan_entries(path, parts, extensions, ignore)
+        if self.stats is not None:
+            self._count_scan(parts, dirs, files, excluded)
+        return dirs, files, excluded
+
+    def _scan_entries(self, path, parts, extensions=None, ignore=None):
+        dirs = []
+        files = []
+        excluded = []
+
+        with os.scandir(path) as it:
+            for entry in it:
+                is_dir = _entry_is_dir(entry)
+                if not is_dir and extensions is not None and not entry.name.lower().endswith(extensions):
+                    continue
+
+                if self._is_excluded(parts, entry.name, entry.path) or (
+                        ignore is not None and ignore.match(entry.name, is_dir)):
+                    excluded.append(entry)
+                elif is_dir:
+                    dirs.append(entry)
+                else:
+                    files.append(entry)
+
+        dirs.sort(key=_entry_sort_key)
+        files.sort(key=_entry_sort_key)
+        return dirs, files, excluded
 
-        path_str = str(abs_path).replace('\\', '/')
-        path_lower = path_str.lower()
+    def _count_scan(self, parts, dirs, files, excluded):
+        counters = self.stats.counters
+        counters["dirs_visited"] += 1
+        counters["entries_kept"] += len(dirs) + len(files)
+        counters["entries_excluded"] += len(excluded)
 
-        cwd = Path.cwd().absolute()
-        cwd_str = str(cwd).replace('\\', '/')
-        cwd_lower = cwd_str.lower()
+        for entry in excluded:
+            if parts is None:
+                pattern = self.exclusion_matcher.explain_path(entry.path)
+            else:
+                pattern = self.exclusion_matcher.explain(parts + (entry.name.lower(),))
+            self.stats.excluded_by[pattern or ".gitignore"] += 1
+
+    @staticmethod
+    def _child_parts(parts, name):
+        if parts is None:
+            return None
+        return parts + (name.lower(),)
+
+    def _is_excluded(self, parent_parts, name, full_path):
+        if parent_parts is None:
+            return self.exclusion_matcher.match_path(full_path)
+        return self.exclusion_matcher.match(parent_parts + (name.lower(),))
+
+    def try_read_file(self, file_path):
+        try:
+            with open(self.fs_path(file_path), 'rb') as f:
+                raw_data = f.read()
+
+            return self.decode_bytes(raw_data)[0]
 
-        if path_lower.startswith(cwd_lower + '/'):
-            rel_path = path_str[len(cwd_str) + 1:]
-            rel_path_lower = rel_path.lower()
+        except Exception as e:
+            raise UnicodeDecodeError(f"Не удалось прочитать файл {file_path}: {e}")
+
+    def decode_bytes(self, raw_data, hint=None):
+        return detect_and_decode(raw_data, hint)
+
+    @staticmethod
+    def segment_header(file_path):
+        return f"\n{'=' * 80}\n# Файл: {file_path}\n{'=' * 80}\n\n".encode('utf-8')
+
+    @staticmethod
+    def format_body(content, raw_data=None):
+        if raw_data is not None:
+            body = normalize_utf8_newlines(raw_data)
         else:
-            rel_path = path_str
-            rel_path_lower = rel_path.lower()
+            body = normalize_newlines(content).encode('utf-8')
 
-        for pattern in self.config.get("excluded", []):
-            pattern = pattern.strip()
-            if not pattern:
+        if body and not body.endswith(b'\n'):
+            body += b'\n'
+        return body
+
+    def format_segment(self, file_path, content, raw_data=None):
+        return self.segment_header(file_path) + self.format_body(content, raw_data) + b'\n'
+
+    def reference_segment(self, file_path, original):
+        return self.segment_header(file_path) + f"[Дубликат: содержимое совпадает с {original}]\n\n".encode('utf-8')
+
+    def deleted_segment(self, file_path):
+        return self.segment_header(file_path) + "[Файл удален]\n\n".encode('utf-8')
+
+    def content_length(self, entry):
+        return entry.get("raw_length", entry["length"]) - len(self.segment_header(entry["path"])) - 1
+
+    def map_ordered(self, func, items):
+        workers = self.config.get("read_workers", 0) or min(32, (os.cpu_count() or 1) + 4)
+
+        if workers <= 1 or len(items) <= 1:
+            for item in items:
+                try:
+                    yield item, func(item), None
+                except Exception as e:
+                    yield item, None, e
+            return
+
+        window = max(self.config.get("read_window", 64), workers)
+        pending = deque()
+        remaining = iter(items)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in itertools.islice(remaining, window):
+                pending.append((item, executor.submit(func, item)))
+
+            while pending:
+                item, future = pending.popleft()
+                try:
+                    result = (item, future.result(), None)
+                except Exception as e:
+                    result = (item, None, e)
+
+                for next_item in itertools.islice(remaining, 1):
+                    pending.append((next_item, executor.submit(func, next_item)))
+
+                yield result
+
+    def collect_all_files(self, output_file=None):
+        if output_file is None:
+            output_file = self.output_path(self.bundle_name("code.txt"))
+        else:
+            self.exclude_output(output_file)
+        self.exclude_shards(output_file)
+
+        file_types = self.config.get("file_types", [".py"])
+        self.log(f"Поиск файлов с расширениями: {', '.join(file_types)}...")
+        skipped = []
+        files, excluded_count = self.find_files_by_types(None, file_types, skipped)
+        return self._write_code_file(files, excluded_count, output_file, skipped)
+
+    def _write_code_file(self, files, excluded_count, output_file, skipped=None):
+        if skipped is None:
+            skipped = []
+        if not files:
+            self._print_skipped(skipped)
+            self.log("Не найдено файлов для обработки")
+            return None
+
+        with self.phase("manifest"):
+            previous = self.load_manifest(output_file)
+        walk_skipped = len(skipped)
+
+        prepared = self.map_ordered(self.segment_preparer(previous), files)
+        written = self._write_bundle(output_file, previous, prepared, len(files), skipped)
+        if written is None:
+            return None
+        return self._finish_bundle(output_file, files, written, excluded_count, skipped, walk_skipped)
+
+    def _write_bundle(self, output_file, previous, prepared, total, skipped):
+        budget = self.shard_budget()
+        if budget:
+            try:
+                return self._write_shards(output_file, prepared, total, skipped, budget)
+            except Exception as e:
+                self.log(f"Ошибка записи в файл: {e}")
+                return None
+
+        temp_file = output_file + ".tmp"
+
+        try:
+            with open(temp_file, 'wb') as out_f, self.phase("segments"):
+                if previous:
+                    with open(output_file, 'rb') as old_f:
+                        entries, reused_count, processed = self._write_prepared(prepared, total, out_f, old_f,
+                                                                                skipped)
+                else:
+                    entries, reused_count, processed = self._write_prepared(prepared, total, out_f, None, skipped)
+
+            if not processed:
+                os.remove(temp_file)
+                return None
+
+            os.replace(temp_file, output_file)
+            with self.phase("manifest"):
+                self.save_manifest(output_file, entries)
+                self.save_bundle_index(output_file, entries)
+            return entries, reused_count, None
+
+        except Exception as e:
+            self.log(f"Ошибка записи в файл: {e}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return None
+
+    def _finish_bundle(self, output_file, files, written, excluded_count, skipped, walk_skipped):
+        entries, reused_count, shards = written
+        with self.phase("manifest"):
+            self.encoding_cache.retain(files)
+            if self.config.get("outline", False):
+                self.outline_cache.retain(entry["hash"] for entry in entries)
+            if self.config.get("content_index", False):
+                self.content_index.retain(files)
+            self.save_caches()
+
+        self.log(f"✓ Собрано {len(entries)} файлов (исключено: {excluded_count})")
+        if reused_count:
+            self.log(f"✓ Без изменений (скопировано из прошлой сборки): {reused_count}")
+        self._print_encoding_stats(entries)
+        duplicates, dedup_saved = self._dedup_summary(entries)
+        outlined = self._outline_summary(entries)
+        stripped = self._strip_summary(entries)
+        self._print_skipped(skipped)
+        if shards is not None:
+            output_file = self.shards_manifest_path(output_file)
+            self.log(f"✓ Шардов: {len(shards)} (лимит {format_size(self.shard_budget())})")
+        self.log(f"✓ Результат сохранен в: {output_file}")
+
+        result = {
+            "output": output_file,
+            "files": len(entries),
+            "outlined": outlined,
+            "stripped": stripped,
+            "errors": len(files) - len(entries) - (len(skipped) - walk_skipped),
+            "excluded": excluded_count,
+            "reused": reused_count,
+            "skipped": [{"path": path, "reason": reason} for path, reason in skipped],
+            "duplicates": duplicates,
+            "dedup_saved": dedup_saved,
+            "bytes": sum(entry["length"] for entry in entries),
+        }
+        if shards is not None:
+            result["shards"] = [{"path": shard["path"], "files": len(shard["files"]), "bytes": shard["bytes"]}
+                                for shard in shards]
+        return result
+
+    async def collect_all_files_async(self, output_file=None):
+        if output_file is None:
+            output_file = self.output_path(self.bundle_name("code.txt"))
+        else:
+            self.exclude_output(output_file)
+        self.exclude_shards(output_file)
+
+        file_types = self.config.get("file_types", [".py"])
+        self.log(f"Поиск файлов с расширениями: {', '.join(file_types)}...")
+
+        loop = asyncio.get_running_loop()
+        workers = self.config.get("read_workers", 0) or min(32, (os.cpu_count() or 1) + 4)
+        window = max(self.config.get("read_window", 64), workers)
+        previous = await asyncio.to_thread(self.load_manifest, output_file)
+        prepare = self.segment_preparer(previous)
+
+        files = []
+        skipped = []
+        counts = {"excluded": 0}
+        slots = asyncio.Semaphore(window)
+        paths = asyncio.Queue()
+        results = asyncio.Queue()
+        state = {"next": 0, "buffer": {}, "finished": 0, "stopped": False}
+
+        async def admit(item):
+            await slots.acquire()
+            await paths.put(item)
+
+        def produce():
+            try:
+                for file_path in self.iter_files_by_types(None, file_types, skipped, counts):
+                    if state["stopped"]:
+                        break
+                    files.append(file_path)
+                    asyncio.run_coroutine_threadsafe(admit((len(files) - 1, file_path)), loop).result()
+            finally:
+                for _ in range(workers):
+                    loop.call_soon_threadsafe(paths.put_nowait, None)
+
+        async def read(pool):
+            while True:
+                item = await paths.get()
+                if item is None:
+                    await results.put(None)
+                    return
+
+                seq, file_path = item
+                try:
+                    outcome = (file_path, await loop.run_in_executor(pool, prepare, file_path), None)
+                except Exception as e:
+                    outcome = (file_path, None, e)
+                await results.put((seq, outcome))
+
+        async def next_ordered():
+            while state["next"] not in state["buffer"]:
+                if state["stopped"]:
+                    raise RuntimeError("сборка отменена")
+                if state["finished"] == workers:
+                    return None
+                item = await results.get()
+                if item is None:
+                    state["finished"] += 1
+                else:
+                    state["buffer"][item[0]] = item[1]
+
+            slots.release()
+            state["next"] += 1
+            return state["buffer"].pop(state["next"] - 1)
+
+        def ordered():
+            while True:
+                outcome = asyncio.run_coroutine_threadsafe(next_ordered(), loop).result()
+                if outcome is None:
+                    return
+                yield outcome
+
+        def release_slots():
+            for _ in range(window):
+                slots.release()
+
+        def write():
+            try:
+                return self._write_bundle(output_file, previous, ordered(), None, skipped)
+            finally:
+                state["stopped"] = True
+                loop.call_soon_threadsafe(release_slots)
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        readers = [asyncio.create_task(read(pool)) for _ in range(workers)]
+        threads = asyncio.gather(asyncio.to_thread(produce), asyncio.to_thread(write))
+        try:
+            _, written = await asyncio.shield(threads)
+        except BaseException:
+            # Потоки нельзя прервать: останавливаем их и ждем, чтобы писатель
+            # удалил временный файл, а не опубликовал неполную сборку
+            state["stopped"] = True
+            release_slots()
+            for task in readers:
+                task.cancel()
+            results.put_nowait(None)
+            await asyncio.gather(threads, return_exceptions=True)
+            raise
+        finally:
+            for task in readers:
+                task.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+        if not files:
+            self._print_skipped(skipped)
+            self.log("Не найдено файлов для обработки")
+            return None
+        if written is None:
+            return None
+
+        file_set = set(files)
+        walk_skipped = sum(1 for path, _ in skipped if path not in file_set)
+        return await asyncio.to_thread(self._finish_bundle, output_file, files, written, counts["excluded"],
+                                       skipped, walk_skipped)
+
+    def segment_preparer(self, previous):
+        self.encoding_cache.load()
+        if self.config.get("outline", False):
+            self.outline_cache.load()
+        if self.config.get("content_index", False):
+            self.content_index.load()
+
+        def prepare(file_path):
+            return self._prepare_segment(file_path, previous.get(file_path))
+
+        if self.stats is not None:
+            return self.stats.timed(prepare)
+        return prepare
+
+    def _write_segments(self, files, previous, out_f, old_f, skipped=None):
+        prepared = self.map_ordered(self.segment_preparer(previous), files)
+        entries, reused_count, _ = self._write_prepared(prepared, len(files), out_f, old_f, skipped)
+        return entries, reused_count
+
+    def _write_prepared(self, prepared, total, out_f, old_f, skipped=None):
+        self.encoding_cache.load()
+        entries = []
+        reused_count = 0
+        position = 0
+        copy_offset = copy_length = 0
+        done = 0
+
+        stats = self.stats
+        compression = self.config.get("compression")
+        originals = {} if self.config.get("dedup", False) else None
+
+        if stats is not None:
+            out_f = _StatsWriter(out_f, stats)
+
+        for done, (file_path, result, error) in enumerate(prepared, 1):
+            if stats is not None:
+                self._count_segment(file_path, result, error)
+                written = format_size(stats.counters['bytes_written'])
+                stats.show_progress(f"Файлы: {done}/{total or '?'}, записано {written}", done=done == total)
+
+            if isinstance(error, SkipFile):
+                if skipped is not None:
+                    skipped.append((file_path, str(error)))
+                continue
+            if error is not None:
+                self.log(f"Ошибка при обработке {file_path}: {error}")
                 continue
 
-            pattern_lower = pattern.lower().replace('\\', '/')
+            data, entry = result
 
-            if os.path.isabs(pattern):
-                pattern_abs = Path(pattern).absolute()
-                pattern_str = str(pattern_abs).replace('\\', '/')
-                pattern_str_lower = pattern_str.lower()
-                if path_lower.startswith(pattern_str_lower):
-                    return True
+            if originals is not None:
+                try:
+                    data, entry = self._dedup_segment(file_path, data, entry, originals)
+                except Exception as e:
+                    self.log(f"Ошибка при обработке {file_path}: {e}")
+                    continue
+
+            if data is None:
+                reused_count += 1
+                if copy_length and copy_offset + copy_length == entry["offset"]:
+                    copy_length += entry["length"]
+                else:
+                    if copy_length:
+                        _copy_range(old_f, out_f, copy_offset, copy_length)
+                    copy_offset, copy_length = entry["offset"], entry["length"]
+            else:
+                if copy_length:
+                    _copy_range(old_f, out_f, copy_offset, copy_length)
+                    copy_length = 0
+                entry["length"], raw_length = self._write_member(out_f, data, compression)
+                if compression is not None:
+                    entry["raw_length"] = raw_length
+
+            entry["offset"] = position
+            position += entry["length"]
+            entries.append(entry)
+
+            if originals is not None and "duplicate_of" not in entry:
+                originals.setdefault(entry["hash"], (file_path, self.content_length(entry)))
+
+        if copy_length:
+            _copy_range(old_f, out_f, copy_offset, copy_length)
+        if stats is not None and total is None and done:
+            stats.show_progress(f"Файлы: {done}, записано {format_size(stats.counters['bytes_written'])}", done=True)
+
+        return entries, reused_count, done
+
+    def _write_shards(self, output_file, prepared, total, skipped, budget):
+        stats = self.stats
+        compression = self.config.get("compression")
+        dedup = self.config.get("dedup", False)
+        window = max(self.config.get("read_window", 64), 1)
+        old_paths = self.exclude_shards(output_file)
+        shards = []
+        current = originals = None
+        done = 0
+
+        writers = max(self.config.get("shard_writers", 4), 1)
+        try:
+            with ThreadPoolExecutor(max_workers=writers) as executor, self.phase("segments"):
+                try:
+                    for done, (file_path, result, error) in enumerate(prepared, 1):
+                        if stats is not None:
+                            self._count_segment(file_path, result, error)
+                            stats.show_progress(f"Файлы: {done}/{total or '?'}, шардов {len(shards)}",
+                                                done=done == total)
+
+                        if isinstance(error, SkipFile):
+                            if skipped is not None:
+                                skipped.append((file_path, str(error)))
+                            continue
+                        if error is not None:
+                            self.log(f"Ошибка при обработке {file_path}: {error}")
+                            continue
+
+                        data, entry = result
+                        if isinstance(data, _StreamedSegment):
+                            size = len(data.header) + entry["size"] + 2
+                        else:
+                            size = len(data)
+
+                        if current is None or (current["files"] and current["bytes"] + size > budget):
+                            if current is not None:
+                                current["queue"].put(None)
+                            path = self.shard_path(output_file, len(shards))
+                            current = {"path": path, "files": [], "bytes": 0, "queue": queue.Queue(window)}
+                            current["future"] = executor.submit(self._write_shard, path, current["queue"],
+                                                                compression)
+                            shards.append(current)
+                            originals = {} if dedup else None
+
+                        if originals is not None:
+                            data, entry = self._dedup_segment(file_path, data, entry, originals)
+                            if "duplicate_of" not in entry:
+                                content_length = size - len(self.segment_header(file_path)) - 1
+                                originals.setdefault(entry["hash"], (file_path, content_length))
+
+                        current["queue"].put((data, entry))
+                        current["files"].append(file_path)
+                        current["bytes"] += size
+                finally:
+                    if current is not None:
+                        current["queue"].put(None)
+
+                entries = []
+                for shard in shards:
+                    shard["entries"] = shard_entries = shard["future"].result()
+                    entries.extend(shard_entries)
+                    shard["bytes"] = sum(entry["length"] for entry in shard_entries)
+        except BaseException:
+            for shard in shards:
+                if os.path.exists(shard["path"] + ".tmp"):
+                    os.remove(shard["path"] + ".tmp")
+            raise
+
+        if not done:
+            return None
+        if stats is not None:
+            stats.counters["shards"] = len(shards)
+
+        for shard in shards:
+            os.replace(shard["path"] + ".tmp", shard["path"])
+            self.save_bundle_index(shard["path"], shard["entries"])
 
+        manifest_path = self.shards_manifest_path(output_file)
+        directory = os.path.dirname(manifest_path)
+        with self.phase("manifest"):
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": 1,
+                    "budget": budget,
+                    "compression": compression,
+                    "shards": [{"path": os.path.relpath(shard["path"], directory or "."), "bytes": shard["bytes"],
+                                "files": shard["files"]} for shard in shards],
+                }, f, ensure_ascii=False)
+
+        written = {shard["path"] for shard in shards}
+        for path in old_paths:
+            if path not in written:
+                for stale in (path, bundle_index_path(path)):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+
+        for shard in shards:
+            del shard["queue"], shard["future"]
+        return entries, 0, shards
+
+    def _write_shard(self, path, items, compression):
+        entries = []
+        position = 0
+        error = None
+
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as out_f:
+            while True:
+                item = items.get()
+                if item is None:
+                    break
+                if error is not None:
+                    continue
+
+                data, entry = item
+                try:
+                    entry["length"], raw_length = self._write_member(out_f, data, compression)
+                except Exception as e:
+                    error = e
+                    continue
+                if compression is not None:
+                    entry["raw_length"] = raw_length
+                entry["offset"] = position
+                position += entry["length"]
+                entries.append(entry)
+
+        if error is not None:
+            os.remove(temp_path)
+            raise error
+        return entries
+
+    def _dedup_segment(self, file_path, data, entry, originals):
+        original = originals.get(entry["hash"])
+        if original is not None:
+            reference = self.reference_segment(file_path, original[0])
+            if original[1] > len(reference) - len(self.segment_header(file_path)) - 1:
+                if data is None and entry.get("duplicate_of") == original[0]:
+                    return None, entry
+                entry["duplicate_of"] = original[0]
+                return reference, entry
+
+        if data is None and "duplicate_of" in entry:
+            return self._prepare_segment(file_path)
+        return data, entry
+
+    def _dedup_summary(self, entries):
+        by_path = {entry["path"]: entry for entry in entries}
+        duplicates = [entry for entry in entries if "duplicate_of" in entry]
+        saved = sum(self.content_length(by_path[entry["duplicate_of"]]) - self.content_length(entry)
+                    for entry in duplicates)
+        if duplicates:
+            self.log(f"✓ Дубликатов: {len(duplicates)}, сэкономлено: {format_size(saved)}")
+        return len(duplicates), saved
+
+    def _outline_summary(self, entries):
+        outlined = [entry for entry in entries if entry.get("outline")]
+        if outlined:
+            source = sum(entry["size"] for entry in outlined)
+            written = sum(self.content_length(entry) for entry in outlined)
+            self.log(f"✓ Только сигнатуры: {len(outlined)} файлов, {format_size(source)} → {format_size(written)}")
+        return len(outlined)
+
+    def _strip_summary(self, entries):
+        stripped = [entry for entry in entries if entry.get("stripped")]
+        source = sum(entry["size"] for entry in stripped)
+        written = sum(self.content_length(entry) for entry in stripped)
+        if stripped:
+            self.log(f"✓ Без комментариев: {len(stripped)} файлов, {format_size(source)} → {format_size(written)}")
+        return {"files": len(stripped), "bytes_before": source, "bytes_after": written}
+
+    @staticmethod
+    def _write_member(out_f, data, compression):
+        if compression is None:
+            if isinstance(data, _StreamedSegment):
+                length = data.write_to(out_f)
             else:
-                pattern_lower = pattern_lower.replace('\\', '/')
+                out_f.write(data)
+                length = len(data)
+            return length, length
+
+        member = _CompressedMember(out_f, compression)
+        if isinstance(data, _StreamedSegment):
+            raw_length = data.write_to(member)
+        else:
+            member.write(data)
+            raw_length = len(data)
+        return member.finish(), raw_length
+
+    def _count_segment(self, file_path, result, error):
+        counters = self.stats.counters
+        if isinstance(error, SkipFile):
+            counters["files_skipped"] += 1
+            return
+        if error is not None:
+            counters["files_failed"] += 1
+            return
+
+        data, entry = result
+        counters["stat_calls"] += 1
+        if data is None:
+            counters["files_reused"] += 1
+            counters["bytes_reused"] += entry["length"]
+            return
+
+        counters["files_read"] += 1
+        counters["bytes_read"] += entry["size"] * (2 if isinstance(data, _StreamedSegment) else 1)
+        if isinstance(data, _StreamedSegment):
+            counters["files_streamed"] += 1
+        if entry["encoding"] in _FALLBACK_ENCODINGS:
+            counters["encoding_fallbacks"] += 1
+
+    def _print_skipped(self, skipped, limit=20):
+        if not skipped:
+            return
+
+        self.log(f"✓ Пропущено файлов: {len(skipped)}")
+        for file_path, reason in skipped[:limit]:
+            self.log(f"  - {file_path}: {reason}")
+        if len(skipped) > limit:
+            self.log(f"  ... и еще {len(skipped) - limit}")
+
+    def _print_encoding_stats(self, entries):
+        counts = Counter(entry["encoding"] for entry in entries)
+        if counts:
+            summary = ", ".join(f"{encoding}: {count}" for encoding, count in counts.most_common())
+            self.log(f"✓ Кодировки: {summary}")
+
+    def _prepare_segment(self, file_path, previous_entry=None):
+        try:
+            f = open(self.fs_path(file_path), 'rb')
+        except FileNotFoundError:
+            raise SkipFile("файл не найден")
+
+        with f:
+            st = os.fstat(f.fileno())
+            if (previous_entry is not None
+                    and previous_entry["size"] == st.st_size
+                    and previous_entry["mtime_ns"] == st.st_mtime_ns):
+                return None, dict(previous_entry)
+
+            outline = self.config.get("outline", False) and file_path.lower().endswith(".py")
+            strip_kind = STRIP_KINDS.get(os.path.splitext(file_path)[1].lower()) if self.config.get(
+                "strip", False) else None
+            if st.st_size > self.config.get("stream_threshold", 1024 * 1024) and not (outline or strip_kind):
+                return self._prepare_streamed_segment(file_path, f, st)
 
-                if pattern_lower.endswith('/*'):
-                    dir_pattern = pattern_lower[:-2]
-                    if rel_path_lower.startswith(dir_pattern + '/') or rel_path_lower == dir_pattern:
-                        return True
-                    if path_lower.endswith('/' + dir_pattern) or path_lower.endswith('/' + dir_pattern + '/'):
-                        return True
+            prefix = f.read(BINARY_SNIFF_SIZE)
+            self._check_binary(prefix)
+            raw_data = prefix + f.read()
 
-                elif '*' in pattern_lower:
-                    if fnmatch.fnmatch(rel_path_lower, pattern_lower) or fnmatch.fnmatch(path_lower, pattern_lower):
-                        return True
-                    if fnmatch.fnmatch(os.path.basename(rel_path_lower), pattern_lower):
-                        return True
+        content, encoding = self.decode_bytes(raw_data, self.encoding_cache.get(file_path, st))
+        self.encoding_cache.put(file_path, st, encoding)
+        entry = {
+            "path": file_path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": hashlib.sha1(raw_data).hexdigest(),
+            "encoding": encoding,
+        }
+        if self.config.get("content_index", False) and not self.content_index.fresh(file_path, st):
+            self.content_index.add(file_path, st, raw_data if encoding == 'utf-8' else content.encode('utf-8'))
+        if outline:
+            text = self.outline_text(entry["hash"], content)
+            if text is not None:
+                entry["outline"] = True
+                return self.format_segment(file_path, text), entry
+        if strip_kind is not None:
+            text = self.run_in_process("strip", strip_source, content, strip_kind)
+            if text is not None:
+                entry["stripped"] = True
+                if self.stats is not None:
+                    self.stats.count("files_stripped")
+                return self.format_segment(file_path, text), entry
 
-                else:
-                    if pattern_lower in rel_path_lower.split('/') or pattern_lower in path_lower.split('/'):
-                        path_parts = rel_path_lower.split('/')
-                        if pattern_lower in path_parts:
-                            return True
+        data = self.format_segment(file_path, content, raw_data if encoding == 'utf-8' else None)
+        return data, entry
 
-                    if rel_path_lower == pattern_lower or path_lower.endswith('/' + pattern_lower):
-                        return True
+    def outline_text(self, digest, content):
+        cached = self.outline_cache.get(digest)
+        if cached is not None:
+            if self.stats is not None:
+                self.stats.count("outline_cache_hits")
+            return cached[0]
 
-        return False
+        outline = self.run_in_process("outline", python_outline, content)
 
-    def find_files_by_types(self, root_dir=".", file_types=None):
-        if file_types is None:
-            file_types = self.config.get("file_types", [".py"])
+        if self.stats is not None:
+            self.stats.count("outlines_parsed")
+        self.outline_cache.put(digest, outline)
+        return outline
 
-        files = []
-        excluded_count = 0
+    def save_caches(self):
+        self.encoding_cache.save()
+        self.outline_cache.save()
+        self.content_index.save()
+        with self._process_lock:
+            for pool in self._process_pools.values():
+                pool.shutdown()
+            self._process_pools.clear()
 
-        for root, dirs, filenames in os.walk(root_dir):
-            dirs_to_remove = []
-            for d in dirs:
-                full_dir_path = os.path.join(root, d)
-                if self.should_exclude(full_dir_path):
-                    dirs_to_remove.append(d)
-                    excluded_count += 1
+    def run_in_process(self, kind, func, *args):
+        workers = self.config.get(f"{kind}_workers", 0) or os.cpu_count() or 1
+        if workers <= 1:
+            return func(*args)
 
-            for d in dirs_to_remove:
-                dirs.remove(d)
+        with self._process_lock:
+            pool = self._process_pools.get(kind)
+            if pool is None:
+                pool = self._process_pools[kind] = ProcessPoolExecutor(max_workers=workers)
+        return pool.submit(func, *args).result()
 
-            for filename in filenames:
-                if any(filename.lower().endswith(ext.lower()) for ext in file_types):
-                    full_path = os.path.join(root, filename)
-                    if not self.should_exclude(full_path):
-                        files.append(full_path)
-                    else:
-                        excluded_count += 1
+    def _check_binary(self, prefix):
+        if self.config.get("skip_binary", True) and looks_binary(prefix):
+            raise SkipFile("похож на бинарный файл")
 
-        return files, excluded_count
+    def _prepare_streamed_segment(self, file_path, f, st):
+        prefix = f.read(ENCODING_PROBE_SIZE)
+        f.seek(0)
+        self._check_binary(prefix[:BINARY_SNIFF_SIZE])
 
-    def try_read_file(self, file_path):
-        try:
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
+        encoding = self.encoding_cache.get(file_path, st) or sniff_encoding(prefix)
+        utf8_ok = encoding is None and utf8_prefix_ok(prefix, len(prefix) == st.st_size)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        digest = hashlib.sha1()
+        has_breaks = False
+        tail = b''
 
-            encodings = ['utf-8', 'utf-8-sig', 'cp1251', 'latin-1', 'iso-8859-1']
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
 
-            for encoding in encodings:
+            digest.update(chunk)
+            if utf8_ok:
                 try:
-                    return raw_data.decode(encoding)
+                    decoder.decode(chunk)
                 except UnicodeDecodeError:
-                    continue
+                    utf8_ok = False
+            if not has_breaks:
+                boundary = tail + chunk[:2]
+                has_breaks = any(char in chunk or char in boundary for char in _RAW_BREAK_CHARS)
+            tail = chunk[-2:]
 
+        if utf8_ok:
             try:
-                return raw_data.decode('utf-16')
+                decoder.decode(b'', True)
+                encoding = 'utf-8'
             except UnicodeDecodeError:
-                pass
+                utf8_ok = False
 
-            return raw_data.decode('utf-8', errors='ignore')
+        if encoding is None:
+            encoding = next(enc for enc in _FALLBACK_ENCODINGS if _stream_decodes(f, enc))
 
-        except Exception as e:
-            raise UnicodeDecodeError(f"Не удалось прочитать файл {file_path}: {e}")
+        self.encoding_cache.put(file_path, st, encoding)
+        if self.config.get("content_index", False) and not self.content_index.fresh(file_path, st):
+            self.content_index.add(file_path, st, None)
 
-    def collect_all_files(self):
-        file_types = self.config.get("file_types", [".py"])
-        print(f"Поиск файлов с расширениями: {', '.join(file_types)}...")
-        files, excluded_count = self.find_files_by_types(".", file_types)
+        entry = {
+            "path": file_path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": digest.hexdigest(),
+            "encoding": encoding,
+        }
+        segment = _StreamedSegment(self.fs_path(file_path), self.segment_header(file_path), encoding,
+                                   raw_copy=encoding == 'utf-8' and not has_breaks)
+        return segment, entry
 
-        if not files:
-            print("Не найдено файлов для обработки")
-            return
+    def manifest_fingerprint(self):
+        key_items = [self.config.get("excluded", []), self.config.get("file_types", [])]
+        if self.config.get("use_gitignore", False):
+            key_items.append("gitignore")
+        if self.config.get("file_source", "walk") != "walk":
+            key_items.append(self.config["file_source"])
+        if self.config.get("compression"):
+            key_items.append(self.config["compression"])
+        if self.config.get("dedup", False):
+            key_items.append("dedup")
+        if self.config.get("outline", False):
+            key_items.append("outline")
+        if self.config.get("strip", False):
+            key_items.append("strip")
+        if not self.config.get("skip_binary", True):
+            key_items.append("binary")
+        if self.size_limits() is not None:
+            key_items.append(self.size_limits())
+        key = json.dumps(key_items, ensure_ascii=False)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
-        output_file = "code.txt"
+    def load_manifest(self, output_file):
+        if not self.manifest_file.exists() or self.shard_budget():
+            return {}
 
         try:
-            with open(output_file, 'w', encoding='utf-8', newline='\n') as out_f:
-                for file_path in files:
-                    try:
-                        content = self.try_read_file(file_path)
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
 
-                        out_f.write(f"\n{'=' * 80}\n")
-                        out_f.write(f"# Файл: {file_path}\n")
-                        out_f.write(f"{'=' * 80}\n\n")
+            st = os.stat(output_file)
+            if (manifest.get("output") != output_file
+                    or manifest.get("fingerprint") != self.manifest_fingerprint()
+                    or manifest.get("output_size") != st.st_size
+                    or manifest.get("output_mtime_ns") != st.st_mtime_ns):
+                return {}
 
-                        lines = content.splitlines()
-                        for line in lines:
-                            out_f.write(line + '\n')
+            return {entry["path"]: entry for entry in manifest.get("files", [])}
 
-                        out_f.write("\n")
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
 
-                    except Exception as e:
-                        print(f"Ошибка при обработке {file_path}: {e}")
+    def save_manifest(self, output_file, entries):
+        st = os.stat(output_file)
+        manifest = {
+            "version": 1,
+            "output": output_file,
+            "output_size": st.st_size,
+            "output_mtime_ns": st.st_mtime_ns,
+            "fingerprint": self.manifest_fingerprint(),
+            "files": entries,
+        }
+        with open(self.manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
 
-            print(f"✓ Собрано {len(files)} файлов (исключено: {excluded_count})")
-            print(f"✓ Результат сохранен в: {output_file}")
+    def save_bundle_index(self, output_file, entries, extra=None):
+        files = []
+        for entry in entries:
+            item = {
+                "path": entry["path"],
+                "offset": entry["offset"],
+                "length": entry["length"],
+                "content_offset": len(self.segment_header(entry["path"])),
+                "content_length": self.content_length(entry),
+                "hash": entry["hash"],
+                "encoding": entry["encoding"],
+            }
+            if "duplicate_of" in entry:
+                item["duplicate_of"] = entry["duplicate_of"]
+            files.append(item)
 
-        except Exception as e:
-            print(f"Ошибка записи в файл: {e}")
+        index = {
+            "version": 1,
+            "bundle": os.path.basename(output_file),
+            "compression": self.config.get("compression"),
+            "files": files,
+        }
+        if extra:
+            index.update(extra)
+        with open(bundle_index_path(output_file), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
 
     def manage_exceptions(self):
         while True:
@@ -265,7 +3248,7 @@ class PyParser:
             print("Текущие исключения:")
 
             excluded = self.config.get("excluded", [])
-            output_files_set = set(self.output_files + ["pyparser.py", "pyparser_config.json"])
+            output_files_set = set(self.system_files)
 
             for i, item in enumerate(excluded, 1):
                 marker = " [системное]" if item in output_files_set else ""
@@ -331,7 +3314,7 @@ class PyParser:
             indices = [int(n.strip()) - 1 for n in nums.split(',')]
             indices.sort(reverse=True)
 
-            system_files = set(self.output_files + ["pyparser.py", "pyparser_config.json"])
+            system_files = set(self.system_files)
 
             removed_count = 0
             for idx in indices:
@@ -446,43 +3429,171 @@ class PyParser:
         print("Типы файлов сброшены к значениям по умолчанию")
 
     def reset_exceptions(self):
-        default = [".venv", "__pycache__", ".git", "pyparser.py", "pyparser_config.json"] + self.output_files
+        default = [".venv", "__pycache__", ".git"] + self.system_files
         self.config["excluded"] = default.copy()
         self.save_config()
         print("Исключения сброшены к значениям по умолчанию")
         self.ensure_gitignore()
 
     def save_config(self):
+        self.compile_exclusions()
         with open(self.config_file, 'w', encoding='utf-8') as f:
             json.dump(self.config, f, indent=2, ensure_ascii=False)
         print("Конфигурация сохранена")
 
-    def collect_selected_files(self):
-        print("\nВведите названия файлов (через запятую):")
-        print("Можно указывать с расширением или без")
-        user_input = input("Файлы: ").strip()
-        if not user_input:
-            print("Не указаны файлы")
-            return
+    def get_file_index(self, rebuild=False):
+        fingerprint = self.manifest_fingerprint()
+        index_file = self.cache_dir / "file_index.json"
+        persist = self.config.get("persist_file_index", False)
 
-        file_names = [name.strip() for name in user_input.split(',') if name.strip()]
-        file_types = self.config.get("file_types", [".py"])
+        self._file_index_fresh = False
+        if not rebuild:
+            if self._file_index is not None and self._file_index.fingerprint == fingerprint:
+                return self._file_index
 
-        all_files, _ = self.find_files_by_types(".", file_types)
+            if persist and index_file.exists():
+                try:
+                    with open(index_file, 'r', encoding='utf-8') as f:
+                        index = FileIndex.from_dict(json.load(f))
+                    if index.fingerprint == fingerprint and self._dirs_unchanged(index.dirs):
+                        self._file_index = index
+                        return index
+                except (OSError, ValueError):
+                    pass
 
-        selected_files = []
-        for pattern in file_names:
-            matches = []
-            for file_path in all_files:
-                file_name = os.path.basename(file_path)
-                if fnmatch.fnmatch(file_name, pattern) or file_name == pattern:
-                    matches.append(file_path)
+        visited = []
+        files, _ = self.find_files_by_types(None, self.config.get("file_types", [".py"]), visited=visited)
+        with self.phase("index"):
+            self._file_index = FileIndex(files, fingerprint, self._dir_mtimes(visited) if persist else None)
+        self._file_index_fresh = True
+
+        if persist:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                with open(index_file, 'w', encoding='utf-8') as f:
+                    json.dump(self._file_index.to_dict(), f, ensure_ascii=False)
+            except OSError as e:
+                self.log(f"Не удалось сохранить индекс файлов: {e}")
 
+        return self._file_index
+
+    def _dir_mtimes(self, paths):
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(self.fs_path(path)).st_mtime_ns
+            except OSError:
+                pass
+        return mtimes
+
+    def _dirs_unchanged(self, dirs):
+        # Создание, удаление и переименование файла меняют mtime его папки,
+        # поэтому одного stat на папку хватает, чтобы заметить устаревший список
+        if not dirs:
+            return False
+        for path, mtime_ns in dirs.items():
+            try:
+                if os.stat(self.fs_path(path)).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def find_selected_files(self, file_names):
+        index = self.get_file_index()
+        found = [index.find(pattern) for pattern in file_names]
+
+        stale = any(not matches for matches in found) or any(
+            not os.path.exists(self.fs_path(file_path)) for matches in found for file_path in matches
+        )
+        if stale and not self._file_index_fresh:
+            index = self.get_file_index(rebuild=True)
+            found = [index.find(pattern) for pattern in file_names]
+
+        return found
+
+    def refresh_content_index(self, files):
+        index = self.content_index
+        index.load()
+        index.retain(files)
+
+        stale = []
+        for file_path in files:
+            try:
+                if not index.fresh(file_path, os.stat(self.fs_path(file_path))):
+                    stale.append(file_path)
+            except OSError:
+                continue
+
+        for file_path, _, error in self.map_ordered(self._index_file, stale):
+            if error is not None:
+                self.log(f"Ошибка индексации {file_path}: {error}")
+        if self.stats is not None:
+            self.stats.counters["content_index_updates"] += len(stale)
+        index.save()
+
+    def _index_file(self, file_path):
+        with open(self.fs_path(file_path), 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size > self.config.get("stream_threshold", 1024 * 1024):
+                self.content_index.add(file_path, st, None)
+                return
+            prefix = f.read(BINARY_SNIFF_SIZE)
+            if looks_binary(prefix):
+                self.content_index.add(file_path, st, b'')
+                return
+            raw_data = prefix + f.read()
+
+        content, encoding = self.decode_bytes(raw_data, self.encoding_cache.get(file_path, st))
+        self.content_index.add(file_path, st, raw_data if encoding == 'utf-8' else content.encode('utf-8'))
+
+    def find_files_by_content(self, query, regex=False, ignore_case=False):
+        flags = re.IGNORECASE if ignore_case else 0
+        search = re.compile(query if regex else re.escape(query), flags).search
+        files = self.get_file_index().files
+
+        with self.phase("content_index"):
+            self.refresh_content_index(files)
+            candidates = self.content_index.candidates(query_trigrams(query, regex, ignore_case))
+        todo = files if candidates is None else [file_path for file_path in files if file_path in candidates]
+
+        def verify(file_path):
+            with open(self.fs_path(file_path), 'rb') as f:
+                st = os.fstat(f.fileno())
+                prefix = f.read(BINARY_SNIFF_SIZE)
+                if looks_binary(prefix):
+                    return False
+                raw_data = prefix + f.read()
+            return search(self.decode_bytes(raw_data, self.encoding_cache.get(file_path, st))[0]) is not None
+
+        with self.phase("content_verify"):
+            matches = [file_path for file_path, found, _ in self.map_ordered(verify, todo) if found]
+        if self.stats is not None:
+            self.stats.counters["content_candidates"] += len(todo)
+            self.stats.counters["content_matches"] += len(matches)
+        return matches
+
+    def collect_selected_files(self, file_names=None, output_file=None, contains=(), regex=(), ignore_case=False):
+        interactive = file_names is None and not (contains or regex)
+        if interactive:
+            print("\nВведите названия файлов (через запятую):")
+            print("Можно указывать с расширением или без")
+            user_input = input("Файлы: ").strip()
+            if not user_input:
+                print("Не указаны файлы")
+                return None
+
+            file_names = [name.strip() for name in user_input.split(',') if name.strip()]
+
+        file_names = file_names or []
+        selected_files = []
+        for pattern, matches in zip(file_names, self.find_selected_files(file_names)):
             if not matches:
-                print(f"Не найдено файлов для паттерна: {pattern}")
-            elif len(matches) == 1:
-                selected_files.append(matches[0])
-                print(f"Найден: {matches[0]}")
+                self.log(f"Не найдено файлов для паттерна: {pattern}")
+            elif len(matches) == 1 or not interactive:
+                selected_files.extend(matches)
+                for match in matches:
+                    self.log(f"Найден: {match}")
             else:
                 print(f"\nНайдено несколько файлов для '{pattern}':")
                 for i, match in enumerate(matches, 1):
@@ -505,84 +3616,366 @@ class PyParser:
                     except ValueError:
                         print("Ошибка: введите номера цифрами")
 
+        self.encoding_cache.load()
+        queries = [(query, False) for query in contains] + [(query, True) for query in regex]
+        for query, is_regex in queries:
+            try:
+                matches = self.find_files_by_content(query, is_regex, ignore_case)
+            except re.error as e:
+                self.log(f"Неверное регулярное выражение {query!r}: {e}")
+                continue
+            self.log(f"По содержимому {query!r}: найдено {len(matches)}")
+            selected_files.extend(matches)
+
+        selected_files = list(dict.fromkeys(selected_files))
         if not selected_files:
-            print("Не выбрано ни одного файла")
-            return
+            self.log("Не выбрано ни одного файла")
+            return None
 
-        output_file = "choosen_code.txt"
+        if output_file is None:
+            output_file = self.output_path(self.bundle_name("choosen_code.txt"))
 
         try:
-            with open(output_file, 'w', encoding='utf-8', newline='\n') as out_f:
-                for file_path in selected_files:
-                    try:
-                        content = self.try_read_file(file_path)
+            skipped = []
+            with open(output_file, 'wb') as out_f:
+                entries, _ = self._write_segments(selected_files, {}, out_f, None, skipped)
+            self.save_bundle_index(output_file, entries)
+            self.save_caches()
+
+            self.log(f"\n✓ Собрано {len(entries)} файлов")
+            self._print_encoding_stats(entries)
+            duplicates, dedup_saved = self._dedup_summary(entries)
+            outlined = self._outline_summary(entries)
+            stripped = self._strip_summary(entries)
+            self._print_skipped(skipped)
+            self.log(f"✓ Результат сохранен в: {output_file}")
 
-                        out_f.write(f"\n{'=' * 80}\n")
-                        out_f.write(f"# Файл: {file_path}\n")
-                        out_f.write(f"{'=' * 80}\n\n")
+            return {
+                "output": output_file,
+                "files": len(entries),
+                "outlined": outlined,
+                "stripped": stripped,
+                "errors": len(selected_files) - len(entries) - len(skipped),
+                "skipped": [{"path": path, "reason": reason} for path, reason in skipped],
+                "duplicates": duplicates,
+                "dedup_saved": dedup_saved,
+                "bytes": sum(entry["length"] for entry in entries),
+            }
 
-                        lines = content.splitlines()
-                        for line in lines:
-                            out_f.write(line + '\n')
+        except Exception as e:
+            self.log(f"Ошибка записи в файл: {e}")
+            return None
 
-                        out_f.write("\n")
+    def delta_reference(self, since):
+        if os.path.isfile(since):
+            return ManifestReference(since)
 
-                    except Exception as e:
-                        print(f"Ошибка чтения {file_path}: {e}")
+        found = find_git_dir(self.root)
+        if found is None:
+            raise ValueError("это не файл манифеста, а репозиторий git не найден")
 
-            print(f"\n✓ Собрано {len(selected_files)} файлов")
-            print(f"✓ Результат сохранен в: {output_file}")
+        top, git_dir = found
+        repo = GitRepository(git_dir)
+        commit = repo.resolve(since)
+        prefix = Path(self.root).absolute().relative_to(top).parts
+        matcher = self.exclusion_matcher
 
-        except Exception as e:
-            print(f"Ошибка записи в файл: {e}")
+        blobs = {}
+        tree = repo.subtree(commit, prefix)
+        if tree is not None:
+            prune = lambda names: matcher.match(tuple(name.lower() for name in names))
+            for names, blob in repo.walk_tree(tree, prune):
+                blobs[os.path.join(".", *names)] = blob
+
+        index = {}
+        index_mtime_ns = 0
+        index_prefix = "/".join(prefix) + "/" if prefix else ""
+        try:
+            index_mtime_ns = os.stat(git_dir / "index").st_mtime_ns
+            for path, size, mtime_ns, blob in read_git_index(git_dir / "index", repo.hash_size):
+                if path.startswith(index_prefix):
+                    index[os.path.join(".", *path[len(index_prefix):].split('/'))] = (size, mtime_ns, blob)
+        except (OSError, ValueError, struct.error):
+            pass
 
-    def generate_structure(self):
-        output_file = "structure.txt"
+        return GitReference(since, commit, blobs, index, index_mtime_ns, repo.hash_size)
+
+    def _delta_tracked(self, file_path, extensions):
+        if not file_path.lower().endswith(extensions):
+            return False
+        parts = tuple(name.lower() for name in file_path.replace('\\', '/').split('/')[1:])
+        return not any(self.exclusion_matcher.match(parts[:depth]) for depth in range(1, len(parts) + 1))
+
+    def collect_delta(self, since, output_file=None):
+        if output_file is None:
+            output_file = self.output_path(self.bundle_name("delta.txt"))
+        else:
+            self.exclude_output(output_file)
 
         try:
-            with open(output_file, 'w', encoding='utf-8', newline='\n') as f:
-                f.write(f"Структура проекта: {os.path.basename(os.getcwd())}\n")
-                f.write("=" * 60 + "\n\n")
+            with self.phase("reference"):
+                reference = self.delta_reference(since)
+        except (OSError, ValueError, KeyError, struct.error, zlib.error) as e:
+            self.log(f"Не удалось загрузить точку сравнения {since}: {e}")
+            return None
 
-                self._write_directory_tree(".", f, "", True)
+        file_types = self.config.get("file_types", [".py"])
+        self.log(f"Поиск файлов с расширениями: {', '.join(file_types)}...")
+        skipped = []
+        files, excluded_count = self.find_files_by_types(None, file_types, skipped)
+
+        changes = {"added": [], "modified": []}
+        unchanged = 0
+        with self.phase("compare"):
+            compare = lambda file_path: reference.compare(file_path, self.fs_path(file_path))
+            for file_path, status, error in self.map_ordered(compare, files):
+                if error is not None:
+                    self.log(f"Ошибка при сравнении {file_path}: {error}")
+                elif status is None:
+                    unchanged += 1
+                else:
+                    changes[status].append(file_path)
+
+        present = set(files).union(path for path, _ in skipped)
+        extensions = tuple(ext.lower() for ext in file_types)
+        deleted = [file_path for file_path in reference.paths()
+                   if file_path not in present and self._delta_tracked(file_path, extensions)]
+        changed_set = set(changes["added"] + changes["modified"])
+        changed = [file_path for file_path in files if file_path in changed_set]
+        walk_skipped = len(skipped)
 
-            print(f"✓ Структура проекта сохранена в: {output_file}")
+        try:
+            with open(output_file, 'wb') as out_f:
+                entries, _ = self._write_segments(changed, {}, out_f, None, skipped)
+                for file_path in deleted:
+                    self._write_member(out_f, self.deleted_segment(file_path), self.config.get("compression"))
 
+            self.save_bundle_index(output_file, entries, {"delta": {
+                "since": reference.label,
+                "commit": reference.commit,
+                "added": changes["added"],
+                "modified": changes["modified"],
+                "deleted": deleted,
+            }})
+            self.save_caches()
         except Exception as e:
-            print(f"Ошибка при создании структуры: {e}")
+            self.log(f"Ошибка записи в файл: {e}")
+            return None
+
+        self.log(f"✓ Изменения относительно {reference.label}: добавлено {len(changes['added'])}, "
+                 f"изменено {len(changes['modified'])}, удалено {len(deleted)}, без изменений {unchanged}")
+        self._print_encoding_stats(entries)
+        self._print_skipped(skipped)
+        self.log(f"✓ Результат сохранен в: {output_file}")
+
+        return {
+            "output": output_file,
+            "since": reference.label,
+            "commit": reference.commit,
+            "files": len(entries),
+            "added": changes["added"],
+            "modified": changes["modified"],
+            "deleted": deleted,
+            "unchanged": unchanged,
+            "excluded": excluded_count,
+            "errors": len(changed) - len(entries) - (len(skipped) - walk_skipped),
+            "skipped": [{"path": path, "reason": reason} for path, reason in skipped],
+            "bytes": sum(entry["length"] for entry in entries),
+        }
+
+    def generate_structure(self, output_file=None):
+        if output_file is None:
+            output_file = self.output_path("structure.txt")
+        else:
+            self.exclude_output(output_file)
+
+        return self._write_structure(output_file) is not None
+
+    def collect_all_with_structure(self, output_file=None, structure_file=None):
+        if output_file is None:
+            output_file = self.output_path(self.bundle_name("code.txt"))
+        else:
+            self.exclude_output(output_file)
+        if structure_file is None:
+            structure_file = self.output_path("structure.txt")
+        else:
+            self.exclude_output(structure_file)
+        self.exclude_shards(output_file)
+
+        file_types = self.config.get("file_types", [".py"])
+        self.log(f"Поиск файлов с расширениями: {', '.join(file_types)}...")
+        result = self._write_structure(structure_file, file_types)
+        if result is None:
+            return None
+
+        files, excluded_count, skipped = result
+        return self._write_code_file(files, excluded_count, output_file, skipped)
+
+    def structure_options(self):
+        count_lines = bool(self.config.get("structure_lines", False))
+        return {
+            "depth": self.config.get("structure_depth", 0) or 0,
+            "entries": self.config.get("structure_entries", 0) or 0,
+            "sizes": count_lines or bool(self.config.get("structure_sizes", False)),
+            "lines": count_lines,
+            "buffer": None,
+        }
+
+    @staticmethod
+    def format_totals(totals, options):
+        text = f"{totals[0]} файлов, {format_size(totals[1])}"
+        if options["lines"]:
+            text += f", {totals[2]} строк"
+        return text
+
+    def write_tree(self, file_obj, render):
+        options = self.structure_options()
+        if options["sizes"]:
+            options["buffer"] = []
+
+        file_obj.write(f"Структура проекта: {os.path.basename(os.path.abspath(self.root))}\n")
+        file_obj.write("=" * 60 + "\n\n")
+        totals = render(options)
+        if options["buffer"] is not None:
+            file_obj.write(f"Итого: {self.format_totals(totals, options)}\n\n")
+            file_obj.writelines(options["buffer"])
+
+    def _write_structure(self, output_file, file_types=None):
+        collected = {
+            "files": [],
+            "excluded": 0,
+            "skipped": [],
+            "extensions": tuple(ext.lower() for ext in file_types) if file_types is not None else None,
+            "size_limits": self.size_limits(),
+        }
 
-    def _write_directory_tree(self, path, file_obj, prefix, is_last=True):
         try:
-            items = []
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                if not self.should_exclude(full_path):
-                    items.append((item, full_path))
+            with open(output_file, 'w', encoding='utf-8', newline='\n') as f, self.phase("structure"):
+                self.write_tree(f, lambda options: self._write_directory_tree(
+                    self.root, f, "", True, self.exclusion_matcher.parts_of(self.root),
+                    collected if file_types is not None else None, ".", self.gitignore_chain(self.root), options))
 
-            if not items:
-                return
+            self.log(f"✓ Структура проекта сохранена в: {output_file}")
+
+        except Exception as e:
+            self.log(f"Ошибка при создании структуры: {e}")
+            return None
 
-            items.sort(key=lambda x: (not os.path.isdir(x[1]), x[0].lower()))
+        return collected["files"], collected["excluded"], collected["skipped"]
 
-            for i, (item_name, full_path) in enumerate(items):
-                is_last_item = (i == len(items) - 1)
+    def _write_directory_tree(self, path, file_obj, prefix, is_last=True, parts=None, collected=None,
+                              display_path=None, ignore=None, options=None, depth=1):
+        if display_path is None:
+            display_path = path
+        if options is None:
+            options = self.structure_options()
 
-                if is_last:
-                    connector = "└── "
-                    next_prefix = prefix + "    "
-                else:
-                    connector = "├── "
-                    next_prefix = prefix + "│   "
+        buffer = options["buffer"]
+        write = None
+        if file_obj is not None:
+            write = buffer.append if buffer is not None else file_obj.write
+        totals = [0, 0, 0]
 
-                file_obj.write(f"{prefix}{connector}{item_name}\n")
+        try:
+            dirs, files, excluded = self.scan_directory(path, parts, None, ignore)
+
+            if collected is not None:
+                extensions = collected["extensions"]
+                self._add_files(collected["files"], display_path,
+                                [entry for entry in files if entry.name.lower().endswith(extensions)],
+                                collected["size_limits"], collected["skipped"])
+                collected["excluded"] += sum(
+                    1 for entry in excluded
+                    if _entry_is_dir(entry) or entry.name.lower().endswith(extensions)
+                )
 
-                if os.path.isdir(full_path):
-                    self._write_directory_tree(full_path, file_obj, next_prefix, is_last_item)
+            # Скрытые папки обходятся только ради сбора файлов или итогов по размеру
+            totals = self.write_tree_level(
+                file_obj, prefix, is_last, [(entry.name, entry.is_symlink()) for entry in dirs],
+                [(entry.name, entry.path) for entry in files], options, depth, collected is not None,
+                lambda i, out, next_prefix, last: self._write_directory_tree(
+                    dirs[i].path, out, next_prefix, last, self._child_parts(parts, dirs[i].name), collected,
+                    os.path.join(display_path, dirs[i].name), self._child_ignore(ignore, dirs[i]), options,
+                    depth + 1))
 
         except PermissionError:
-            file_obj.write(f"{prefix}└── [Доступ запрещен]\n")
+            if file_obj is not None:
+                write(f"{prefix}└── [Доступ запрещен]\n")
         except Exception as e:
-            file_obj.write(f"{prefix}└── [Ошибка: {str(e)}]\n")
+            if file_obj is not None:
+                write(f"{prefix}└── [Ошибка: {str(e)}]\n")
+
+        return totals
+
+    def write_tree_level(self, file_obj, prefix, is_last, dirs, files, options, depth, descend, open_dir):
+        buffer = options["buffer"]
+        write = None
+        if file_obj is not None:
+            write = buffer.append if buffer is not None else file_obj.write
+        totals = [0, 0, 0]
+
+        count = len(dirs) + len(files)
+        visible = file_obj is not None
+        shown = count
+        if visible and options["entries"] and count > options["entries"]:
+            shown = options["entries"]
+        descend = descend or options["sizes"]
+        hidden = [0, 0, 0]
+
+        if is_last:
+            connector = "└── "
+            next_prefix = prefix + "    "
+        else:
+            connector = "├── "
+            next_prefix = prefix + "│   "
+
+        for i, (name, is_link) in enumerate(dirs):
+            show = visible and i < shown
+            if show:
+                line = len(buffer) if buffer is not None else None
+                write(f"{prefix}{connector}{name}\n")
+            else:
+                hidden[0] += 1
+            if is_link:
+                continue
+
+            open_child = show and (not options["depth"] or depth < options["depth"])
+            if not (open_child or descend):
+                continue
+            sub = open_dir(i, file_obj if open_child else None, next_prefix, i == count - 1)
+            for k in range(3):
+                totals[k] += sub[k]
+            if not show:
+                hidden[2] += sub[1]
+            elif buffer is not None:
+                buffer[line] = f"{prefix}{connector}{name}  [{self.format_totals(sub, options)}]\n"
+
+        for i, (name, path) in enumerate(files, len(dirs)):
+            show = visible and i < shown
+            if show:
+                write(f"{prefix}{connector}{name}\n")
+
+            size = 0
+            if options["sizes"] or not show and visible:
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    pass
+            totals[0] += 1
+            totals[1] += size
+            if options["lines"]:
+                try:
+                    totals[2] += count_lines(path)
+                except OSError:
+                    pass
+            if not show:
+                hidden[1] += 1
+                hidden[2] += size
+
+        if shown < count:
+            counts = [f"{number} {name}" for number, name in ((hidden[1], "файлов"), (hidden[0], "папок")) if number]
+            write(f"{prefix}{connector}… еще {', '.join(counts)} ({format_size(hidden[2])})\n")
+        return totals
 
     def show_menu(self):
         print("\n" + "=" * 40)
@@ -593,8 +3986,9 @@ class PyParser:
         print("3. Собрать выбранные файлы в txt (choosen_code.txt)")
         print("4. Создать структуру проекта в txt (structure.txt)")
         print("5. Управление типами файлов")
-        print("6. Выход")
-        return input("\nВыберите действие (1-6): ").strip()
+        print("6. Собрать файлы и структуру за один проход (code.txt + structure.txt)")
+        print("7. Выход")
+        return input("\nВыберите действие (1-7): ").strip()
 
     def main_loop(self):
         while True:
@@ -612,6 +4006,8 @@ class PyParser:
                 elif choice == "5":
                     self.manage_file_types()
                 elif choice == "6":
+                    self.collect_all_with_structure()
+                elif choice == "7":
                     print("\nДо свидания!")
                     break
                 else:
@@ -629,8 +4025,717 @@ class PyParser:
                 input("\nНажмите Enter для продолжения...")
 
 
+class WatchSession:
+    def __init__(self, parser, output_file=None, structure_file=None, debounce=0.2, polling=False, interval=1.0,
+                 overrides=None):
+        self.parser = parser
+        if output_file is None:
+            output_file = parser.output_path(parser.bundle_name("code.txt"))
+        else:
+            parser.exclude_output(output_file)
+        if structure_file is None:
+            structure_file = parser.output_path("structure.txt")
+        else:
+            parser.exclude_output(structure_file)
+
+        self.output_file = output_file
+        self.structure_file = structure_file
+        self.own_files = {os.path.abspath(path) for path in (output_file, output_file + ".tmp", structure_file,
+                                                             bundle_index_path(output_file))}
+        self.debounce = debounce
+        self.interval = interval
+        self.overrides = overrides or {}
+        self.nodes = {}
+        self.by_path = {}
+        self.watcher = None
+        if not polling:
+            try:
+                self.watcher = InotifyWatcher()
+            except OSError as e:
+                parser.log(f"inotify недоступен ({e}), используется опрос")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(interval)
+
+    def run(self):
+        try:
+            self.build()
+            self.parser.log("Наблюдение за изменениями (Ctrl+C для выхода)...")
+            while True:
+                events = self.watcher.poll()
+                while True:
+                    more = self.watcher.poll(self.debounce)
+                    if not more:
+                        break
+                    events.extend(more)
+                if events:
+                    self.apply(events)
+        except KeyboardInterrupt:
+            self.parser.log("\nНаблюдение остановлено")
+        finally:
+            self.watcher.close()
+
+    def build(self):
+        for path in list(self.by_path):
+            self.watcher.remove(path)
+        self.nodes.clear()
+        self.by_path.clear()
+
+        parser = self.parser
+        self.extensions = tuple(ext.lower() for ext in parser.config.get("file_types", [".py"]))
+        self.size_limits = parser.size_limits()
+        with parser.phase("walk"):
+            self.scan_tree(".", parser.root, parser.exclusion_matcher.parts_of(parser.root),
+                           parser.gitignore_chain(parser.root))
+
+        self.write_structure()
+        parser.log(f"✓ Структура проекта сохранена в: {self.structure_file}")
+        files, excluded_count, skipped = self.collect_files()
+        return self.write_code(files, None, excluded_count, skipped)
+
+    def scan_tree(self, display, path, parts, ignore):
+        stack = [(display, path, parts, ignore)]
+        while stack:
+            display, path, parts, ignore = stack.pop()
+            node = self.scan_node(display, path, parts, ignore)
+            for name in reversed(node["dirs"]):
+                if name not in node["links"]:
+                    child_path = os.path.join(path, name)
+                    stack.append((os.path.join(display, name), child_path, self.parser._child_parts(parts, name),
+                                  ignore.child(name, child_path) if ignore is not None else None))
+
+    def scan_node(self, display, path, parts, ignore):
+        node = {"path": path, "parts": parts, "ignore": ignore, "dirs": [], "links": set(), "files": [],
+                "sizes": {}, "excluded": 0, "error": None}
+        try:
+            dirs, files, excluded = self.parser.scan_directory(path, parts, None, ignore)
+        except PermissionError:
+            node["error"] = "[Доступ запрещен]"
+        except OSError as e:
+            node["error"] = f"[Ошибка: {str(e)}]"
+        else:
+            node["dirs"] = [entry.name for entry in dirs]
+            node["links"] = {entry.name for entry in dirs if entry.is_symlink()}
+            node["files"] = [entry.name for entry in files]
+            node["excluded"] = sum(1 for entry in excluded
+                                   if _entry_is_dir(entry) or entry.name.lower().endswith(self.extensions))
+            if self.size_limits is not None:
+                for entry in files:
+                    try:
+                        node["sizes"][entry.name] = entry.stat().st_size
+                    except OSError:
+                        pass
+
+        self.nodes[display] = node
+        self.by_path[path] = display
+        self._watch(path)
+        return node
+
+    def _watch(self, path):
+        try:
+            self.watcher.add(path)
+        except OSError as e:
+            self.parser.log(f"inotify: {e}, переключение на опрос")
+            self.watcher.close()
+            self.watcher = PollingWatcher(self.interval)
+            for watched in self.by_path:
+                self.watcher.add(watched)
+
+    def drop(self, display):
+        node = self.nodes.pop(display, None)
+        if node is None:
+            return
+        self.by_path.pop(node["path"], None)
+        self.watcher.remove(node["path"])
+        for name in node["dirs"]:
+            self.drop(os.path.join(display, name))
+
+    def collect_files(self):
+        files = []
+        skipped = []
+        excluded_count = 0
+        stack = ["."]
+
+        while stack:
+            display = stack.pop()
+            node = self.nodes.get(display)
+            if node is None:
+                continue
+
+            excluded_count += node["excluded"]
+            for name in node["files"]:
+                if not name.lower().endswith(self.extensions):
+                    continue
+                file_path = os.path.join(display, name)
+                size = node["sizes"].get(name)
+                reason = None
+                if self.size_limits is not None and size is not None:
+                    reason = self.parser.size_limit_reason(name, size, self.size_limits)
+                if reason is None:
+                    files.append(file_path)
+                else:
+                    skipped.append((file_path, reason))
+
+            stack.extend(os.path.join(display, name) for name in reversed(node["dirs"]) if name not in node["links"])
+
+        return files, excluded_count, skipped
+
+    def write_structure(self):
+        with open(self.structure_file, 'w', encoding='utf-8', newline='\n') as f, self.parser.phase("structure"):
+            self.parser.write_tree(f, lambda options: self._write_node(".", f, "", True, options, 1))
+
+    def _write_node(self, display, file_obj, prefix, is_last, options, depth):
+        node = self.nodes.get(display)
+        if node is None:
+            return [0, 0, 0]
+        if node["error"] is not None:
+            line = f"{prefix}└── {node['error']}\n"
+            if options["buffer"] is not None and file_obj is not None:
+                options["buffer"].append(line)
+            elif file_obj is not None:
+                file_obj.write(line)
+            return [0, 0, 0]
+
+        dirs = node["dirs"]
+        return self.parser.write_tree_level(
+            file_obj, prefix, is_last, [(name, name in node["links"]) for name in dirs],
+            [(name, os.path.join(node["path"], name)) for name in node["files"]], options, depth, False,
+            lambda i, out, next_prefix, last: self._write_node(os.path.join(display, dirs[i]), out, next_prefix,
+                                                               last, options, depth + 1))
+
+    def write_code(self, files, dirty, excluded_count, skipped):
+        parser = self.parser
+        if not files:
+            parser._print_skipped(skipped)
+            parser.log("Не найдено файлов для обработки")
+            return None
+
+        with parser.phase("manifest"):
+            previous = parser.load_manifest(self.output_file)
+        walk_skipped = len(skipped)
+
+        todo = [file_path for file_path in files if dirty is None or file_path in dirty or file_path not in previous]
+        ready = {file_path: (result, error)
+                 for file_path, result, error in parser.map_ordered(parser.segment_preparer(previous), todo)}
+        prepared = ((file_path, *ready[file_path]) if file_path in ready
+                    else (file_path, (None, dict(previous[file_path])), None) for file_path in files)
+
+        written = parser._write_bundle(self.output_file, previous, prepared, len(files), skipped)
+        if written is None:
+            return None
+        if dirty is None:
+            return parser._finish_bundle(self.output_file, files, written, excluded_count, skipped, walk_skipped)
+
+        parser.encoding_cache.retain(files)
+        parser.save_caches()
+        return len(todo)
+
+    def apply(self, events):
+        started = time.perf_counter()
+        parser = self.parser
+
+        if None in events:
+            parser.log("Очередь событий переполнена, полное пересканирование")
+            return self.build()
+
+        rescan = set()
+        dirty = set()
+        for dir_path, name in events:
+            display = self.by_path.get(dir_path)
+            node = self.nodes.get(display)
+            if node is None or node["error"] is not None:
+                continue
+
+            full_path = os.path.join(dir_path, name)
+            if display == "." and name == parser.config_file.name:
+                parser.log("Изменен конфиг, полная пересборка")
+                parser.config = parser.load_config()
+                parser.apply_overrides(**self.overrides)
+                return self.build()
+            if name == ".gitignore" and parser.config.get("use_gitignore", False):
+                parser.log("Изменен .gitignore, полная пересборка")
+                return self.build()
+            if os.path.abspath(full_path) in self.own_files or parser._is_excluded(node["parts"], name, full_path):
+                continue
+
+            is_dir = os.path.isdir(full_path)
+            if node["ignore"] is not None and node["ignore"].match(name, is_dir):
+                continue
+
+            if name in node["files"] and not is_dir and os.path.lexists(full_path):
+                if self.size_limits is not None:
+                    try:
+                        node["sizes"][name] = os.stat(full_path).st_size
+                    except OSError:
+                        rescan.add(display)
+            elif name not in node["dirs"] or not is_dir:
+                rescan.add(display)
+            dirty.add(os.path.join(display, name))
+
+        for display in sorted(rescan, key=len):
+            node = self.nodes.get(display)
+            if node is None:
+                continue
+            old_dirs = set(node["dirs"]) - node["links"]
+            new_node = self.scan_node(display, node["path"], node["parts"], node["ignore"])
+            new_dirs = set(new_node["dirs"]) - new_node["links"]
+
+            for name in old_dirs - new_dirs:
+                self.drop(os.path.join(display, name))
+            for name in sorted(new_dirs - old_dirs):
+                child_path = os.path.join(node["path"], name)
+                ignore = node["ignore"]
+                self.scan_tree(os.path.join(display, name), child_path, parser._child_parts(node["parts"], name),
+                               ignore.child(name, child_path) if ignore is not None else None)
+
+        # Итоги по размеру и строкам и хвост "… еще" зависят от содержимого файлов, а не только от списка
+        options = parser.structure_options()
+        if rescan or dirty and (options["sizes"] or options["entries"]):
+            self.write_structure()
+
+        files, excluded_count, skipped = self.collect_files()
+        if not rescan and not dirty.intersection(files):
+            return None
+
+        updated = self.write_code(files, dirty, excluded_count, skipped)
+        if updated is not None:
+            parser.log(f"✓ Обновлено за {time.perf_counter() - started:.2f} с: "
+                       f"перечитано файлов {updated}, всего {len(files)}")
+        return updated
+
+
+def _parse_types(value):
+    return [ext.strip() for ext in value.split(',') if ext.strip()]
+
+
+def _parse_size(value):
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    value = value.strip().lower().rstrip("b")
+    try:
+        if value[-1:] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверный размер: {value}")
+
+
+def make_parser(root=".", excluded=None, file_types=None, config=None, verbose=False, stats=None, **overrides):
+    parser = PyParser(root, config=config, verbose=verbose)
+    parser.apply_overrides(excluded, file_types, **overrides)
+    parser.stats = stats
+    return parser
+
+
+def collect(root=".", output=None, excluded=None, file_types=None, config=None, with_structure=False,
+            structure_output=None, verbose=False, stats=None, **overrides):
+    parser = make_parser(root, excluded, file_types, config, verbose, stats, **overrides)
+    if with_structure:
+        return parser.collect_all_with_structure(output, structure_output)
+    return parser.collect_all_files(output)
+
+
+async def collect_async(root=".", output=None, excluded=None, file_types=None, config=None, verbose=False,
+                        stats=None, **overrides):
+    parser = make_parser(root, excluded, file_types, config, verbose, stats, **overrides)
+    return await parser.collect_all_files_async(output)
+
+
+def select(root=".", patterns=(), output=None, excluded=None, file_types=None, config=None, verbose=False,
+           stats=None, contains=(), regex=(), ignore_case=False, **overrides):
+    parser = make_parser(root, excluded, file_types, config, verbose, stats, **overrides)
+    return parser.collect_selected_files(list(patterns), output, contains, regex, ignore_case)
+
+
+def delta(root=".", since="HEAD", output=None, excluded=None, file_types=None, config=None, verbose=False, stats=None,
+          **overrides):
+    parser = make_parser(root, excluded, file_types, config, verbose, stats, **overrides)
+    return parser.collect_delta(since, output)
+
+
+def watch(root=".", output=None, structure_output=None, excluded=None, file_types=None, config=None, verbose=False,
+          debounce=0.2, polling=False, interval=1.0, **overrides):
+    overrides.update(excluded=excluded, file_types=file_types)
+    parser = make_parser(root, config=config, verbose=verbose, **overrides)
+    session = WatchSession(parser, output, structure_output, debounce, polling, interval, overrides)
+    session.run()
+    return session
+
+
+def structure(root=".", output=None, excluded=None, config=None, verbose=False, stats=None, **overrides):
+    parser = make_parser(root, excluded, None, config, verbose, stats, **overrides)
+    return parser.generate_structure(output)
+
+
+def extract(bundle, paths=(), start=0, length=None):
+    with BundleReader(bundle) as reader:
+        return {path: reader.read_range(path, start, length) for path in (paths or reader.paths())}
+
+
+def find_repositories(repos_dir):
+    roots = []
+    with os.scandir(repos_dir) as it:
+        for entry in it:
+            if entry.is_dir() and not entry.name.startswith('.'):
+                roots.append(entry.path)
+    return sorted(roots, key=lambda path: os.path.basename(path).lower())
+
+
+def _batch_output_names(roots):
+    names = []
+    used = Counter()
+    for root in roots:
+        name = os.path.basename(os.path.abspath(root)) or "root"
+        used[name] += 1
+        names.append(name if used[name] == 1 else f"{name}_{used[name]}")
+    return names
+
+
+def _bundle_repository(task):
+    root, output, structure_output, excluded, file_types, overrides = task
+    started = time.perf_counter()
+    result = {"root": root, "output": output, "files": 0, "bytes": 0, "excluded": 0, "error": None}
+
+    try:
+        # Репозитории уже разобраны по процессам batch; вложенные пулы дали бы ~ядер² процессов
+        parser = make_parser(root, excluded, file_types, **{**overrides, "outline_workers": 1, "strip_workers": 1})
+        if structure_output is not None:
+            summary = parser.collect_all_with_structure(output, structure_output)
+        else:
+            summary = parser.collect_all_files(output)
+
+        if summary is None:
+            result["error"] = "нет файлов для обработки или ошибка записи"
+        else:
+            result.update(summary)
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def batch(roots, output_dir=None, excluded=None, file_types=None, with_structure=False, workers=None,
+          verbose=False, **overrides):
+    names = _batch_output_names(roots)
+    suffix = COMPRESSION_SUFFIXES.get(overrides.get("compression"), "")
+    tasks = []
+    for root, name in zip(roots, names):
+        if output_dir is None:
+            output = os.path.join(root, "code.txt" + suffix)
+            structure_output = os.path.join(root, "structure.txt") if with_structure else None
+        else:
+            output = os.path.join(output_dir, f"{name}.code.txt{suffix}")
+            structure_output = os.path.join(output_dir, f"{name}.structure.txt") if with_structure else None
+        tasks.append((root, output, structure_output, excluded, file_types, overrides))
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_bundle_repository, tasks):
+            results.append(result)
+            if verbose:
+                status = f"ошибка: {result['error']}" if result["error"] else \
+                    f"{result['files']} файлов, {result['bytes']} байт"
+                print(f"[{len(results)}/{len(tasks)}] {result['root']}: {status} ({result['seconds']} с)")
+
+    return {
+        "repositories": results,
+        "total_files": sum(result["files"] for result in results),
+        "total_bytes": sum(result["bytes"] for result in results),
+        "failed": sum(1 for result in results if result["error"]),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# Опции командной строки, которые переопределяют одноименные (или указанные) ключи конфига
+_CLI_OVERRIDES = {
+    "gitignore": "use_gitignore", "source": "file_source", "compress": "compression", "dedup": "dedup",
+    "walk_workers": "walk_workers", "outline": "outline", "strip": "strip", "shard_size": "shard_size",
+    "shard_tokens": "shard_tokens", "content_index": "content_index", "depth": "structure_depth",
+    "max_entries": "structure_entries", "sizes": "structure_sizes", "lines": "structure_lines",
+}
+
+
+def _cli_overrides(args):
+    return {key: getattr(args, dest) for dest, key in _CLI_OVERRIDES.items() if getattr(args, dest, None) is not None}
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog="pyparser", description="PyParser - Парсер Python проектов")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+    def add_common(sub):
+        sub.add_argument("--root", default=".", help="Корневая папка проекта (по умолчанию текущая)")
+        sub.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                         help="Дополнительное исключение, можно указывать несколько раз")
+        sub.add_argument("-q", "--quiet", action="store_true", help="Не выводить сообщения о ходе работы")
+        sub.add_argument("--stats", metavar="FILE", help="Сохранить замеры по этапам в JSON")
+        sub.add_argument("--progress", action="store_true", help="Показывать строку прогресса")
+        sub.add_argument("--gitignore", action="store_true", default=None,
+                         help="Учитывать .gitignore и .git/info/exclude")
+        sub.add_argument("--walk-workers", type=int, metavar="N",
+                         help="Обходить папки в N потоков (0 или 1 - последовательно)")
+
+    def add_bundle_options(sub):
+        sub.add_argument("--types", type=_parse_types, metavar=".py,.md",
+                         help="Типы файлов через запятую вместо значений из конфига")
+        sub.add_argument("--source", choices=["walk", "git"],
+                         help="Откуда брать список файлов: обход папок или индекс git")
+        sub.add_argument("--compress", choices=["none", "gzip", "xz"],
+                         help="Сжимать результат, каждый файл отдельным блоком")
+        sub.add_argument("--dedup", action="store_true", default=None,
+                         help="Записывать одинаковые файлы один раз, остальные - ссылкой")
+        sub.add_argument("--outline", action="store_true", default=None,
+                         help="Для .py записывать только импорты, сигнатуры и первые строки docstring")
+        sub.add_argument("--strip", action="store_true", default=None,
+                         help="Убирать комментарии и docstring (.py, .js, .css, .html) и лишние пустые строки")
+
+    def add_structure_options(sub):
+        sub.add_argument("--depth", type=int, metavar="N", help="Показывать в структуре не глубже N уровней")
+        sub.add_argument("--max-entries", type=int, metavar="N",
+                         help="Показывать в папке не больше N элементов, остальные - одной строкой")
+        sub.add_argument("--sizes", action="store_true", default=None,
+                         help="Писать у папок число файлов и общий размер")
+        sub.add_argument("--lines", action="store_true", default=None,
+                         help="Также считать строки (читает все файлы)")
+
+    collect_parser = subparsers.add_parser("collect", help="Собрать все файлы (code.txt)")
+    add_common(collect_parser)
+    add_bundle_options(collect_parser)
+    collect_parser.add_argument("-o", "--output", help="Путь к файлу результата")
+    collect_parser.add_argument("--with-structure", action="store_true",
+                                help="Записать structure.txt за тот же проход")
+    collect_parser.add_argument("--structure-output", help="Путь к файлу структуры")
+    add_structure_options(collect_parser)
+    collect_parser.add_argument("--shard-size", type=_parse_size, metavar="SIZE",
+                                help="Делить результат на части не больше SIZE (например 50M)")
+    collect_parser.add_argument("--shard-tokens", type=int, metavar="N",
+                                help="Делить результат на части примерно по N токенов")
+    collect_parser.add_argument("--content-index", action="store_true", default=None,
+                                help="Обновлять триграммный индекс содержимого для select --contains/--regex")
+
+    select_parser = subparsers.add_parser("select", help="Собрать выбранные файлы (choosen_code.txt)")
+    add_common(select_parser)
+    add_bundle_options(select_parser)
+    select_parser.add_argument("patterns", nargs="*", help="Имена файлов или паттерны")
+    select_parser.add_argument("-o", "--output", help="Путь к файлу результата")
+    select_parser.add_argument("--contains", action="append", default=[], metavar="TEXT",
+                               help="Выбрать файлы, содержащие TEXT (можно повторять)")
+    select_parser.add_argument("--regex", action="append", default=[], metavar="PATTERN",
+                               help="Выбрать файлы, в которых найдено регулярное выражение")
+    select_parser.add_argument("-i", "--ignore-case", action="store_true",
+                               help="Не учитывать регистр в --contains и --regex")
+
+    delta_parser = subparsers.add_parser("delta", help="Собрать только изменённые файлы (delta.txt)")
+    add_common(delta_parser)
+    add_bundle_options(delta_parser)
+    delta_parser.add_argument("--since", required=True, metavar="REF",
+                              help="Путь к pyparser_manifest.json или коммит git (HEAD, HEAD~1, ветка, тег, хеш)")
+    delta_parser.add_argument("-o", "--output", help="Путь к файлу результата")
+
+    watch_parser = subparsers.add_parser("watch", help="Держать code.txt и structure.txt в актуальном состоянии")
+    watch_parser.add_argument("--root", default=".", help="Корневая папка проекта (по умолчанию текущая)")
+    watch_parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                              help="Дополнительное исключение, можно указывать несколько раз")
+    watch_parser.add_argument("-q", "--quiet", action="store_true", help="Не выводить сообщения о ходе работы")
+    watch_parser.add_argument("--gitignore", action="store_true", default=None,
+                              help="Учитывать .gitignore и .git/info/exclude")
+    watch_parser.add_argument("--types", type=_parse_types, metavar=".py,.md",
+                              help="Типы файлов через запятую вместо значений из конфига")
+    watch_parser.add_argument("--compress", choices=["none", "gzip", "xz"],
+                              help="Сжимать результат, каждый файл отдельным блоком")
+    watch_parser.add_argument("--dedup", action="store_true", default=None,
+                              help="Записывать одинаковые файлы один раз, остальные - ссылкой")
+    watch_parser.add_argument("--outline", action="store_true", default=None,
+                              help="Для .py записывать только импорты, сигнатуры и первые строки docstring")
+    watch_parser.add_argument("--strip", action="store_true", default=None,
+                              help="Убирать комментарии и docstring (.py, .js, .css, .html) и лишние пустые строки")
+    watch_parser.add_argument("-o", "--output", help="Путь к файлу результата")
+    watch_parser.add_argument("--structure-output", help="Путь к файлу структуры")
+    add_structure_options(watch_parser)
+    watch_parser.add_argument("--debounce", type=float, default=0.2, metavar="SEC",
+                              help="Ждать тишины столько секунд перед обновлением")
+    watch_parser.add_argument("--poll", action="store_true", help="Опрашивать папки вместо inotify")
+    watch_parser.add_argument("--interval", type=float, default=1.0, metavar="SEC",
+                              help="Период опроса в секундах")
+
+    structure_parser = subparsers.add_parser("structure", help="Создать структуру проекта (structure.txt)")
+    add_common(structure_parser)
+    structure_parser.add_argument("-o", "--output", help="Путь к файлу результата")
+    add_structure_options(structure_parser)
+
+    batch_parser = subparsers.add_parser("batch", help="Собрать code.txt для нескольких репозиториев")
+    batch_parser.add_argument("roots", nargs="*", help="Корневые папки репозиториев")
+    batch_parser.add_argument("--repos-dir", help="Папка, каждая подпапка которой - отдельный репозиторий")
+    batch_parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                              help="Дополнительное исключение для всех репозиториев")
+    add_bundle_options(batch_parser)
+    batch_parser.add_argument("--output-dir", help="Куда складывать результаты (по умолчанию в каждый репозиторий)")
+    batch_parser.add_argument("--with-structure", action="store_true", help="Также записать structure.txt")
+    batch_parser.add_argument("-j", "--workers", type=int, help="Число процессов (по умолчанию по числу ядер)")
+    batch_parser.add_argument("--report", help="Сохранить отчет в JSON")
+    batch_parser.add_argument("-q", "--quiet", action="store_true", help="Не выводить сообщения о ходе работы")
+
+    extract_parser = subparsers.add_parser("extract", help="Достать файлы из сборки по индексу (.idx)")
+    extract_parser.add_argument("bundle", help="Путь к code.txt (или .gz/.xz)")
+    extract_parser.add_argument("paths", nargs="*", help="Пути файлов в сборке (по умолчанию список файлов)")
+    extract_parser.add_argument("--start", type=int, default=0, help="Смещение внутри файла в байтах")
+    extract_parser.add_argument("--length", type=int, help="Сколько байт прочитать")
+    extract_parser.add_argument("-o", "--output", help="Записать результат в файл вместо вывода")
+
+    config_parser = subparsers.add_parser("config", help="Показать или изменить pyparser_config.json")
+    config_parser.add_argument("--root", default=".", help="Корневая папка проекта (по умолчанию текущая)")
+    config_parser.add_argument("--add-exclude", action="append", default=[], metavar="PATTERN")
+    config_parser.add_argument("--remove-exclude", action="append", default=[], metavar="PATTERN")
+    config_parser.add_argument("--add-type", action="append", default=[], metavar="EXT")
+    config_parser.add_argument("--remove-type", action="append", default=[], metavar="EXT")
+    config_parser.add_argument("--reset", action="store_true", help="Сбросить исключения и типы файлов")
+    config_parser.add_argument("--use-gitignore", choices=["on", "off"], help="Учитывать .gitignore при обходе")
+
+    return arg_parser
+
+
+def run_config_command(args):
+    parser = PyParser(args.root)
+    changed = False
+
+    if args.reset:
+        parser.config = parser.default_config()
+        changed = True
+
+    for item in args.add_exclude:
+        item = item.replace('\\', '/')
+        if item not in parser.config["excluded"]:
+            parser.config["excluded"].append(item)
+            changed = True
+
+    for item in args.remove_exclude:
+        if item in parser.system_files:
+            print(f"Нельзя удалить системное исключение: {item}")
+        elif item in parser.config["excluded"]:
+            parser.config["excluded"].remove(item)
+            changed = True
+
+    for ext in args.add_type:
+        ext = ext if ext.startswith('.') else '.' + ext
+        if ext not in parser.config["file_types"]:
+            parser.config["file_types"].append(ext)
+            changed = True
+
+    for ext in args.remove_type:
+        ext = ext if ext.startswith('.') else '.' + ext
+        if ext in parser.config["file_types"]:
+            parser.config["file_types"].remove(ext)
+            changed = True
+
+    if args.use_gitignore is not None and parser.config["use_gitignore"] != (args.use_gitignore == "on"):
+        parser.config["use_gitignore"] = args.use_gitignore == "on"
+        changed = True
+
+    if changed:
+        parser.save_config()
+
+    print(json.dumps(parser.config, indent=2, ensure_ascii=False))
+    return 0
+
+
+def run_extract_command(args):
+    try:
+        with BundleReader(args.bundle) as reader:
+            paths = reader.paths()
+            if args.paths:
+                data = b''.join(reader.read_range(path, args.start, args.length) for path in args.paths)
+    except KeyError as e:
+        print(f"Файл не найден в сборке: {e.args[0]}")
+        return 1
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"Ошибка чтения сборки: {e}")
+        return 1
+
+    if not args.paths:
+        print("\n".join(paths))
+    elif args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+    else:
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+    return 0
+
+
+def run_batch_command(args):
+    roots = list(args.roots)
+    if args.repos_dir:
+        roots.extend(find_repositories(args.repos_dir))
+    if not roots:
+        print("Не указаны репозитории")
+        return 1
+
+    verbose = not args.quiet
+    report = batch(roots, args.output_dir, args.exclude, args.types, args.with_structure, args.workers, verbose,
+                   **_cli_overrides(args))
+
+    if verbose:
+        print(f"\n✓ Репозиториев: {len(roots)} (с ошибками: {report['failed']})")
+        print(f"✓ Файлов: {report['total_files']}, байт: {report['total_bytes']}, время: {report['seconds']} с")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        if verbose:
+            print(f"✓ Отчет сохранен в: {args.report}")
+
+    return 1 if report["failed"] else 0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if not argv:
+        PyParser().run_interactive()
+        return 0
+
+    arg_parser = build_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.command == "select" and not (args.patterns or args.contains or args.regex):
+        arg_parser.error("select: укажите паттерны имен или --contains/--regex")
+    verbose = not getattr(args, "quiet", False)
+
+    if args.command == "config":
+        return run_config_command(args)
+    if args.command == "batch":
+        return run_batch_command(args)
+    if args.command == "extract":
+        return run_extract_command(args)
+    if args.command == "watch":
+        watch(args.root, args.output, args.structure_output, args.exclude, args.types, verbose=verbose,
+              debounce=args.debounce, polling=args.poll, interval=args.interval, **_cli_overrides(args))
+        return 0
+    stats = Stats(progress=args.progress) if args.stats or args.progress else None
+    overrides = _cli_overrides(args)
+    if args.command == "collect":
+        result = collect(args.root, args.output, args.exclude, args.types, with_structure=args.with_structure,
+                         structure_output=args.structure_output, verbose=verbose, stats=stats, **overrides)
+    elif args.command == "select":
+        result = select(args.root, args.patterns, args.output, args.exclude, args.types, verbose=verbose,
+                        stats=stats, contains=args.contains, regex=args.regex, ignore_case=args.ignore_case,
+                        **overrides)
+    elif args.command == "delta":
+        result = delta(args.root, args.since, args.output, args.exclude, args.types, verbose=verbose, stats=stats,
+                       **overrides)
+    else:
+        result = structure(args.root, args.output, args.exclude, verbose=verbose, stats=stats, **overrides)
+
+    if args.stats:
+        stats.save(args.stats)
+    return 0 if result else 1
+
+
 if __name__ == "__main__":
     if sys.platform == "win32":
         os.system("chcp 65001 > nul")
 
-    parser = PyParser()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def git(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git не найден")
+    env = dict(os.environ, GIT_CONFIG_NOSYSTEM="1", HOME=str(tmp_path), GIT_AUTHOR_NAME="t",
+               GIT_AUTHOR_EMAIL="t@t", GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@t")
+
+    def run(cwd, *args):
+        return subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True).stdout
+
+    return run
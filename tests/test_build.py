@@ -0,0 +1,92 @@
+import asyncio
+import os
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+import benchmark
+import pyparser
+
+
+@pytest.fixture(scope="module")
+def project(tmp_path_factory):
+    root = tmp_path_factory.mktemp("project")
+    benchmark.generate_tree(str(root), seed=7, depth=3, fanout=4, files=300, size_min=50, size_max=8 * 1024)
+    return root
+
+
+@pytest.fixture(scope="module")
+def full_build(project, tmp_path_factory):
+    return build(project, tmp_path_factory.mktemp("full") / "code.txt", read_workers=1, walk_workers=1)
+
+
+def build(root, output, **overrides):
+    pyparser.collect(str(root), str(output), verbose=False, **overrides)
+    return Path(output).read_bytes()
+
+
+def test_parallel_reads_match_serial_build(project, full_build, tmp_path):
+    assert full_build.count(b"\n# ") > 100
+    assert build(project, tmp_path / "code.txt", read_workers=8, walk_workers=1) == full_build
+
+
+def test_incremental_build_matches_full_build(tmp_path):
+    root = tmp_path / "project"
+    benchmark.generate_tree(str(root), seed=3, depth=2, fanout=3, files=120, size_min=50, size_max=4 * 1024)
+    output = tmp_path / "code.txt"
+    build(root, output)
+
+    files = sorted(path for path in root.rglob("*") if path.is_file() and path.suffix in benchmark.FILE_TYPES)
+    rng = random.Random(3)
+    for path in rng.sample(files, 10):
+        path.write_bytes(path.read_bytes()[::-1].replace(b"\r", b"") + b"\nchanged\n")
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000_000))
+    for path in rng.sample(files, 5):
+        if path.exists():
+            path.unlink()
+    (root / "added.py").write_text("print('added')\n", encoding="utf-8")
+
+    stats = pyparser.Stats()
+    incremental = build(root, output, stats=stats)
+    assert stats.counters["files_reused"] > 50
+    (root / "pyparser_manifest.json").unlink()
+    assert build(root, tmp_path / "fresh.txt") == incremental
+
+
+def test_async_build_matches_serial_build(project, full_build, tmp_path):
+    asyncio.run(pyparser.collect_async(str(project), str(tmp_path / "code.txt"), verbose=False))
+    assert (tmp_path / "code.txt").read_bytes() == full_build
+
+
+def test_cancelled_async_build_keeps_previous_bundle(project, full_build, tmp_path, monkeypatch):
+    output = tmp_path / "code.txt"
+    output.write_bytes(b"old bundle\n")
+    prepare = pyparser.PyParser._prepare_segment
+
+    def slow_prepare(self, *args):
+        time.sleep(0.005)
+        return prepare(self, *args)
+
+    monkeypatch.setattr(pyparser.PyParser, "_prepare_segment", slow_prepare)
+
+    async def run():
+        task = asyncio.ensure_future(pyparser.collect_async(str(project), str(output), verbose=False,
+                                                            read_workers=2))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert output.read_bytes() == b"old bundle\n"
+    assert not os.path.exists(str(output) + ".tmp")
+
+
+def test_parallel_walk_matches_serial_build(project, full_build, tmp_path):
+    assert build(project, tmp_path / "code.txt", read_workers=1, walk_workers=8) == full_build
+    serial = pyparser.make_parser(str(project), excluded=["src0", "*.md"], verbose=False, walk_workers=1)
+    parallel = pyparser.make_parser(str(project), excluded=["src0", "*.md"], verbose=False, walk_workers=8)
+    assert parallel.find_files_by_types() == serial.find_files_by_types()
@@ -0,0 +1,83 @@
+import os
+import re
+
+import pytest
+
+import benchmark
+import pyparser
+
+
+QUERIES = [
+    ("config parser", False, False),
+    ("ДАННЫЕ", False, True),
+    ("строка", False, False),
+    ("Needle", False, True),
+    ("needle-42", False, False),
+    ("ab", False, False),
+    (r"def\s+(value|config)", True, False),
+    (r"(?i)ФАЙЛ\s+строка", True, False),
+    (r"need(le|ful)-\d+", True, False),
+    (r"return.*данные$", True, True),
+    (r"x*", True, False),
+    (r"[", True, False),
+]
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    benchmark.generate_tree(str(root), seed=11, depth=2, fanout=3, files=150, size_min=100, size_max=4000,
+                            encodings="utf-8=0.5,cp1251=0.3,utf-16=0.1,utf-8-sig=0.1")
+    (root / "cp.py").write_bytes("# needle-42 данные\n".encode("cp1251"))
+    (root / "upper.txt").write_text("NEEDLE-7\n", encoding="utf-8")
+    return root
+
+
+def brute_force(parser, query, regex, ignore_case):
+    try:
+        search = re.compile(query if regex else re.escape(query), re.IGNORECASE if ignore_case else 0).search
+    except re.error:
+        return None
+    found = []
+    for file_path in parser.get_file_index().files:
+        with open(os.path.join(parser.root, file_path), 'rb') as f:
+            raw_data = f.read()
+        if not pyparser.looks_binary(raw_data[:pyparser.BINARY_SNIFF_SIZE]) and search(
+                pyparser.detect_and_decode(raw_data)[0]):
+            found.append(file_path)
+    return found
+
+
+def search(root, query, regex, ignore_case):
+    parser = pyparser.make_parser(str(root), verbose=False, stats=pyparser.Stats())
+    try:
+        return parser.find_files_by_content(query, regex, ignore_case), parser
+    except re.error:
+        return None, parser
+
+
+@pytest.mark.parametrize("query, regex, ignore_case", QUERIES)
+def test_candidates_match_brute_force(project, query, regex, ignore_case):
+    found, parser = search(project, query, regex, ignore_case)
+    assert found == brute_force(parser, query, regex, ignore_case)
+
+
+def test_index_prunes_candidates(project):
+    found, parser = search(project, "needle-42", False, False)
+    assert found == ["./cp.py"]
+    assert parser.stats.counters["content_candidates"] < 5
+
+
+def test_index_refreshes_after_changes(project):
+    path = sorted(project.rglob("*.py"))[0]
+    relative = "./" + path.relative_to(project).as_posix()
+
+    assert relative not in search(project, "freshly-added", False, False)[0]
+    path.write_text("freshly-added\n", encoding="utf-8")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000_000))
+    assert search(project, "freshly-added", False, False)[0] == [relative]
+
+    path.write_bytes("совсем другое\n".encode("cp1251"))
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1_000_000_000))
+    assert search(project, "freshly-added", False, False)[0] == []
+    assert relative in search(project, "совсем", False, False)[0]
@@ -0,0 +1,66 @@
+import pytest
+
+import pyparser
+
+
+def source(name, version):
+    lines = [f"def {name}_{i}(value):\n    return value * {i} + {version if i % 7 == 0 else 0}\n" for i in range(300)]
+    return "".join(lines)
+
+
+@pytest.fixture
+def repo(tmp_path, git):
+    root = tmp_path / "repo"
+    (root / "lib" / "deep").mkdir(parents=True)
+    git(root, "init", "-q", "-b", "main")
+
+    def commit(files, removed=(), message="c"):
+        for name, text in files.items():
+            (root / name).write_text(text, encoding="utf-8")
+        for name in removed:
+            (root / name).unlink()
+        git(root, "add", "-A")
+        git(root, "commit", "-q", "-m", message)
+
+    commit({"a.py": source("a", 1), "b.py": source("b", 1), "lib/c.py": source("c", 1), "d.js": "var d = 1;\n",
+            "lib/deep/e.py": source("e", 1), "notes.md": "notes\n"})
+    git(root, "tag", "-a", "v1", "-m", "first release")
+    git(root, "checkout", "-q", "-b", "feature")
+    commit({"b.py": source("b", 2), "lib/feature.py": source("f", 1)})
+    git(root, "checkout", "-q", "main")
+    commit({"a.py": source("a", 2), "f.py": source("f", 1)}, removed=["d.js"])
+    commit({"lib/c.py": source("c", 2), "g.py": source("g", 1)})
+    git(root, "gc", "-q", "--aggressive")
+
+    assert not any((root / ".git" / "objects").glob("[0-9a-f][0-9a-f]/*"))
+    pack = next((root / ".git" / "objects" / "pack").glob("*.idx"))
+    assert any(len(line.split()) == 7 for line in git(root, "verify-pack", "-v", str(pack)).decode().splitlines())
+
+    (root / "a.py").write_text(source("a", 3), encoding="utf-8")
+    (root / "lib" / "deep" / "e.py").unlink()
+    (root / "new.py").write_text(source("n", 1), encoding="utf-8")
+    git(root, "add", "-A")
+    return root
+
+
+@pytest.mark.parametrize("since", ["HEAD", "HEAD~1", "HEAD~2", "main^", "feature", "feature^", "v1", "v1~0"])
+def test_delta_matches_git_diff(repo, git, tmp_path, since):
+    expected = {"A": set(), "M": set(), "D": set()}
+    diff = git(repo, "diff", "--name-status", "--no-renames", since).decode()
+    for line in diff.splitlines():
+        status, path = line.split("\t")
+        if path.endswith((".py", ".js")):
+            expected[status].add(path)
+
+    result = pyparser.delta(str(repo), since, str(tmp_path / "delta.txt"), file_types=[".py", ".js"], verbose=False)
+    assert result is not None
+    actual = {status: {path[2:] if path.startswith("./") else path for path in result[key]}
+              for status, key in (("A", "added"), ("M", "modified"), ("D", "deleted"))}
+    assert actual == expected
+    assert result["commit"] == git(repo, "rev-parse", f"{since}^{{commit}}").decode().strip()
+
+
+def test_delta_accepts_a_commit_hash_prefix(repo, git, tmp_path):
+    commit = git(repo, "rev-parse", "HEAD~1").decode().strip()
+    result = pyparser.delta(str(repo), commit[:10], str(tmp_path / "delta.txt"), file_types=[".py"], verbose=False)
+    assert result["commit"] == commit
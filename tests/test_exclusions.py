@@ -0,0 +1,115 @@
+import fnmatch
+import os
+import random
+from pathlib import Path
+
+import pyparser
+
+
+def baseline_should_exclude(patterns, path):
+    # Исходная PyParser.should_exclude до перехода на ExclusionMatcher
+    path_obj = Path(path)
+    try:
+        abs_path = path_obj.absolute()
+    except:
+        return False
+
+    path_str = str(abs_path).replace('\\', '/')
+    path_lower = path_str.lower()
+
+    cwd = Path.cwd().absolute()
+    cwd_str = str(cwd).replace('\\', '/')
+    cwd_lower = cwd_str.lower()
+
+    if path_lower.startswith(cwd_lower + '/'):
+        rel_path = path_str[len(cwd_str) + 1:]
+        rel_path_lower = rel_path.lower()
+    else:
+        rel_path = path_str
+        rel_path_lower = rel_path.lower()
+
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+
+        pattern_lower = pattern.lower().replace('\\', '/')
+
+        if os.path.isabs(pattern):
+            pattern_abs = Path(pattern).absolute()
+            pattern_str = str(pattern_abs).replace('\\', '/')
+            pattern_str_lower = pattern_str.lower()
+            if path_lower.startswith(pattern_str_lower):
+                return True
+
+        else:
+            pattern_lower = pattern_lower.replace('\\', '/')
+
+            if pattern_lower.endswith('/*'):
+                dir_pattern = pattern_lower[:-2]
+                if rel_path_lower.startswith(dir_pattern + '/') or rel_path_lower == dir_pattern:
+                    return True
+                if path_lower.endswith('/' + dir_pattern) or path_lower.endswith('/' + dir_pattern + '/'):
+                    return True
+
+            elif '*' in pattern_lower:
+                if fnmatch.fnmatch(rel_path_lower, pattern_lower) or fnmatch.fnmatch(path_lower, pattern_lower):
+                    return True
+                if fnmatch.fnmatch(os.path.basename(rel_path_lower), pattern_lower):
+                    return True
+
+            else:
+                if pattern_lower in rel_path_lower.split('/') or pattern_lower in path_lower.split('/'):
+                    path_parts = rel_path_lower.split('/')
+                    if pattern_lower in path_parts:
+                        return True
+
+                if rel_path_lower == pattern_lower or path_lower.endswith('/' + pattern_lower):
+                    return True
+
+    return False
+
+
+NAMES = ["src", "Lib", "app", "node_modules", "build", "a.py", "B.txt", "main.js", "data.json", "tmp"]
+
+
+def random_pattern(rng, root):
+    kind = rng.randrange(7)
+    name = rng.choice(NAMES)
+    if kind == 0:
+        return name.upper() if rng.random() < 0.3 else name
+    if kind == 1:
+        return f"{rng.choice(NAMES)}/{name}"
+    if kind == 2:
+        return f"{rng.choice(NAMES)}/*" if rng.random() < 0.5 else f"{rng.choice(NAMES)}\\{name}/*"
+    if kind == 3:
+        return rng.choice(["*.py", "*.TXT", "*test*", "src/*.js", "*/build/*", "b*.?s*", "*"])
+    if kind == 4:
+        return os.path.join(root, rng.choice(NAMES), *rng.sample(NAMES, rng.randrange(2)))
+    if kind == 5:
+        return f"  {name}  "
+    return rng.choice(["", "   ", ".git", "tmp\\a.py"])
+
+
+def random_path(rng, root):
+    parts = [rng.choice(NAMES) for _ in range(rng.randint(1, 4))]
+    if rng.random() < 0.1:
+        return os.path.join(os.path.dirname(root), *parts)
+    return os.path.join(root, *parts)
+
+
+def test_exclusion_matcher_matches_baseline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = str(Path.cwd())
+    rng = random.Random(1)
+
+    for _ in range(1500):
+        patterns = [random_pattern(rng, root) for _ in range(rng.randint(0, 4))]
+        matcher = pyparser.ExclusionMatcher(patterns, root)
+        for _ in range(10):
+            path = random_path(rng, root)
+            expected = baseline_should_exclude(patterns, path)
+            assert matcher.match_path(path) == expected, (patterns, path)
+            parts = matcher.parts_of(path)
+            if parts:
+                assert matcher.match(parts) == expected, (patterns, path)
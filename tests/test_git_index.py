@@ -0,0 +1,37 @@
+import os
+import random
+
+import pytest
+
+import pyparser
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_read_git_index_matches_ls_files(tmp_path, git, version):
+    root = tmp_path / "repo"
+    root.mkdir()
+    git(root, "init", "-q")
+    rng = random.Random(version)
+    for i in range(60):
+        directory = root.joinpath(*rng.sample(["src", "src_a", "a", "ab", "либ"], rng.randint(0, 3)))
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file{i}{'_long_name' * rng.randint(0, 5)}.py").write_text("x" * i, encoding="utf-8")
+    git(root, "add", "-A")
+    if version == 3:
+        (root / "intent.py").write_text("intent", encoding="utf-8")
+        git(root, "add", "-N", "intent.py")
+    else:
+        git(root, "update-index", "--index-version", str(version))
+
+    index = root / ".git" / "index"
+    assert int.from_bytes(index.read_bytes()[4:8], "big") == version
+
+    expected = []
+    for line in git(root, "ls-files", "-s", "-z").split(b"\0"):
+        if line:
+            info, path = line.split(b"\t", 1)
+            expected.append((os.fsdecode(path), info.split()[1].decode()))
+    entries = pyparser.read_git_index(index)
+    assert [(path, name) for path, _, _, name in entries] == expected
+    for path, size, _, _ in entries:
+        assert size == (0 if path == "intent.py" else (root / path).stat().st_size)
@@ -0,0 +1,39 @@
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+import pyparser
+
+
+IGNORE_RULES = ["*.log", "build/", "/top.py", "!keep.log", "deep/**/x.py", "src/*.txt", "lib", "!lib/ok.py",
+                "*.tmp", "a?.py", "docs/", "!docs/readme.md", "**/cache", "[ab].js", "# комментарий", "sub/a.py",
+                "\\!bang.py", "trail.py   ", "*.md", "!*.md"]
+TREE_DIRS = ["", "src", "lib", "build", "deep", "deep/q", "deep/q/r", "docs", "src/cache", "sub", "sub/sub"]
+TREE_FILES = ["top.py", "x.py", "a1.py", "ab.py", "a.js", "c.js", "keep.log", "e.log", "n.txt", "ok.py",
+              "readme.md", "z.tmp", "!bang.py", "trail.py", "a.py"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_gitignore_matches_git(tmp_path, git, seed):
+    rng = random.Random(seed)
+    root = tmp_path / "repo"
+    root.mkdir()
+    git(root, "init", "-q")
+    for directory in TREE_DIRS:
+        (root / directory).mkdir(parents=True, exist_ok=True)
+        for name in rng.sample(TREE_FILES, rng.randint(3, 8)):
+            (root / directory / name).write_text(name, encoding="utf-8")
+        if rng.random() < 0.6:
+            rules = rng.sample(IGNORE_RULES, rng.randint(1, 5))
+            (root / directory / ".gitignore").write_text("\n".join(rules) + "\n", encoding="utf-8")
+
+    expected = {path for path in git(root, "ls-files", "-co", "--exclude-standard").decode().splitlines()
+                if not path.endswith(".gitignore")}
+    parser = pyparser.make_parser(str(root), file_types=[".py", ".js", ".log", ".txt", ".md", ".tmp"],
+                                  verbose=False, use_gitignore=True, auto_gitignore=False)
+    parser.config["excluded"] = [".git"]
+    files, _ = parser.find_files_by_types()
+    found = {Path(os.path.relpath(os.path.join(root, path), root)).as_posix() for path in files}
+    assert found == expected
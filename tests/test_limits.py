@@ -0,0 +1,73 @@
+import builtins
+from pathlib import Path
+
+import pytest
+
+import pyparser
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / "small.py").write_text("x = 1\n", encoding="utf-8")
+    (root / "big.py").write_text("y = 2\n" * 1000, encoding="utf-8")
+    (root / "page.html").write_text("<p>page</p>\n" * 50, encoding="utf-8")
+    (root / "blob.py").write_bytes(b"\x00\x01\x02" * 200_000)
+    return root
+
+
+def bundled(root, output, **overrides):
+    pyparser.collect(str(root), str(output), verbose=False, **overrides)
+    text = Path(output).read_text(encoding="utf-8")
+    return {name for name in ("small.py", "big.py", "page.html", "blob.py") if f"# Файл: ./{name}\n" in text}
+
+
+def test_size_caps_and_binary_skip(project, tmp_path):
+    assert bundled(project, tmp_path / "a.txt") == {"small.py", "big.py", "page.html"}
+    assert bundled(project, tmp_path / "b.txt", max_file_size=1024) == {"small.py", "page.html"}
+    assert bundled(project, tmp_path / "c.txt", max_file_size=1024, max_size_by_type={".py": 8 * 1024}) == {
+        "small.py", "big.py", "page.html"}
+    assert bundled(project, tmp_path / "d.txt", max_size_by_type={".html": 100}) == {"small.py", "big.py"}
+
+
+def test_toggling_skip_binary_invalidates_incremental_build(project, tmp_path):
+    output = tmp_path / "code.txt"
+    assert "blob.py" not in bundled(project, output)
+    assert "blob.py" in bundled(project, output, skip_binary=False)
+    assert "blob.py" not in bundled(project, output)
+
+
+@pytest.mark.parametrize("overrides", [{}, {"outline": True}, {"strip": True}])
+def test_binary_is_sniffed_before_full_read(project, tmp_path, monkeypatch, overrides):
+    reads = []
+
+    class TrackedFile:
+        def __init__(self, f):
+            self.f = f
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+        def __getattr__(self, name):
+            return getattr(self.f, name)
+
+        def read(self, size=-1):
+            data = self.f.read(size)
+            if self.f.name.endswith("blob.py"):
+                reads.append(len(data))
+            return data
+
+    def tracked_open(path, *args, **kwargs):
+        f = builtins.open(path, *args, **kwargs)
+        return TrackedFile(f) if 'b' in (args[0] if args else kwargs.get("mode", "")) else f
+
+    monkeypatch.setattr(pyparser, "open", tracked_open, raising=False)
+    parser = pyparser.make_parser(str(project), verbose=False, **overrides)
+    parser.collect_all_files(str(tmp_path / "code.txt"))
+    parser.find_files_by_content("needle")
+
+    assert reads and max(reads) <= pyparser.BINARY_SNIFF_SIZE
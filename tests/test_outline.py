@@ -0,0 +1,39 @@
+import ast
+
+import pytest
+
+import pyparser
+
+
+@pytest.mark.parametrize("first_line", [
+    'Setup connection to remote server on "host:port"',
+    'Ends with a quote"',
+    'Ends with an escaped quote \\"',
+    'Ends with triple quotes """',
+    'Ends with many quotes """""',
+    'Contains """ in the middle',
+    'Backslashes: C:\\temp\\new and \\\\server',
+    'Trailing backslash \\',
+    'Unicode escape \\u0041 and \\N{DASH}',
+    "Single quotes ''' inside",
+])
+def test_outline_docstrings_round_trip(first_line):
+    quoted = repr(first_line)
+    source = (f"{quoted}\n\n"
+              f"def f():\n    {quoted}\n    return 1\n\n\n"
+              f"class C:\n    {quoted}\n\n    def m(self):\n        {quoted}\n")
+    outline = pyparser.python_outline(source)
+    tree = ast.parse(outline)
+
+    docs = [ast.get_docstring(tree), ast.get_docstring(tree.body[1]), ast.get_docstring(tree.body[2]),
+            ast.get_docstring(tree.body[2].body[1])]
+    assert docs == [first_line.strip()] * 4
+
+
+def test_outline_keeps_signatures_and_imports():
+    source = ("import os\nfrom typing import List\n\n"
+              "class A(Base, metaclass=M):\n    x = 1\n\n    async def run(self, *args, k: int = 2) -> List[str]:\n"
+              "        return []\n\n\n@decorator\ndef g(a, /, b=None):\n    pass\n")
+    assert pyparser.python_outline(source) == (
+        "import os\nfrom typing import List\nclass A(Base, metaclass=M):\n"
+        "    async def run(self, *args, k: int=2) -> List[str]: ...\n@decorator\ndef g(a, /, b=None): ...\n")
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import benchmark
+import pyparser
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    benchmark.generate_tree(str(root), seed=5, depth=2, fanout=3, files=80, size_min=100, size_max=3000,
+                            encodings="utf-8")
+    return root
+
+
+def shard_files(root):
+    return sorted(path.name for path in root.glob("code.[0-9][0-9][0-9].txt*"))
+
+
+def load_shards(root):
+    with open(root / "code.shards.json", encoding="utf-8") as f:
+        return json.load(f)["shards"]
+
+
+def test_shards_respect_budget_and_concatenate_to_the_bundle(project, tmp_path):
+    pyparser.collect(str(project), str(tmp_path / "code.txt"), verbose=False)
+    pyparser.collect(str(project), verbose=False, shard_size=8 * 1024)
+
+    shards = load_shards(project)
+    assert len(shards) > 3
+    assert shard_files(project) == sorted(name for shard in shards for name in (shard["path"],
+                                                                              shard["path"] + ".idx"))
+    data = b""
+    for shard in shards:
+        content = (project / shard["path"]).read_bytes()
+        assert len(content) == shard["bytes"]
+        assert len(content) <= 8 * 1024 or len(shard["files"]) == 1
+        data += content
+    assert data == (tmp_path / "code.txt").read_bytes()
+
+
+def test_stale_shards_are_removed(project):
+    pyparser.collect(str(project), verbose=False, shard_size=4 * 1024)
+    many = shard_files(project)
+    pyparser.collect(str(project), verbose=False, shard_size=64 * 1024)
+    few = shard_files(project)
+
+    assert len(few) < len(many)
+    assert few == sorted(name for shard in load_shards(project) for name in (shard["path"], shard["path"] + ".idx"))
+
+
+@pytest.mark.parametrize("drop_manifest", [False, True])
+def test_shard_files_are_not_collected(project, drop_manifest):
+    pyparser.collect(str(project), verbose=False, shard_size=8 * 1024)
+    if drop_manifest:
+        (project / "code.shards.json").unlink()
+
+    pyparser.collect(str(project), verbose=False, shard_size=8 * 1024, file_types=[".txt", ".py"])
+    pyparser.collect(str(project), str(project / "code.txt"), verbose=False, file_types=[".txt", ".py"])
+    for path in [project / "code.txt"] + [project / shard["path"] for shard in load_shards(project)]:
+        text = path.read_text(encoding="utf-8")
+        assert "# Файл: ./code." not in text
+    assert pyparser.select(str(project), ["code.*"], verbose=False) is None
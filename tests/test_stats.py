@@ -0,0 +1,23 @@
+import json
+
+import pyparser
+
+
+def test_worker_counters_are_exact_under_parallel_reads(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    for i in range(200):
+        (root / f"m{i}.py").write_text(f"def f{i}(x):\n    return x + {i}\n", encoding="utf-8")
+        (root / f"s{i}.js").write_text(f"var a{i} = {i}; // комментарий\n", encoding="utf-8")
+
+    def run():
+        stats = pyparser.Stats()
+        pyparser.collect(str(root), str(tmp_path / "code.txt"), verbose=False, stats=stats, read_workers=16,
+                         outline=True, strip=True)
+        (root / "pyparser_manifest.json").unlink()
+        return json.loads(json.dumps(stats.to_dict()))["counters"]
+
+    first = run()
+    assert (first["outlines_parsed"], first.get("outline_cache_hits", 0), first["files_stripped"]) == (200, 0, 200)
+    second = run()
+    assert (second.get("outlines_parsed", 0), second["outline_cache_hits"], second["files_stripped"]) == (0, 200, 200)
@@ -0,0 +1,66 @@
+import ast
+
+import pytest
+
+import pyparser
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('var re = /["]/; var u = "http://x.y"; // c\n', 'var re = /["]/; var u = "http://x.y";\n'),
+    ("r = s.replace(/'/g, \"\"); // z\n", "r = s.replace(/'/g, \"\");\n"),
+    ('if (x) return /\\/\\//.test(s) // q\n', 'if (x) return /\\/\\//.test(s)\n'),
+    ('a = b / c; // x\nd = e / f / g;\n', 'a = b / c;\nd = e / f / g;\n'),
+    ('x = a++ / 2 /* m */;\n', 'x = a++ / 2 ;\n'),
+    ('let t = `//not ${1}`;\n/* block\n   comment */\nf();\n', 'let t = `//not ${1}`;\nf();\n'),
+])
+def test_js_keeps_regex_and_string_literals(source, expected):
+    assert pyparser.strip_source(source, "js") == expected
+
+
+def test_html_keeps_script_and_style_bodies():
+    source = ('<p><!-- c --></p>\n'
+              '<script>var a = "<!-- keep -->";</script>\n'
+              '<STYLE>/* <!-- k --> */</STYLE>\n'
+              '<!--[if IE]><p>ie</p><![endif]-->\n'
+              '<!-- gone -->\n')
+    assert pyparser.strip_source(source, "html") == (
+        '<p></p>\n'
+        '<script>var a = "<!-- keep -->";</script>\n'
+        '<STYLE>/* <!-- k --> */</STYLE>\n'
+        '<!--[if IE]><p>ie</p><![endif]-->\n')
+
+
+def test_css_keeps_comment_markers_in_strings():
+    source = 'a { content: "/* x */"; } /* gone */\n'
+    assert pyparser.strip_source(source, "css") == 'a { content: "/* x */"; }\n'
+
+
+def test_python_strip_stays_valid():
+    source = ('"""Модуль."""\n'
+              'import os  # комментарий\n\n\n'
+              'def f(x):\n'
+              '    """Докстринг."""\n'
+              '    s = """многострочная   \n'
+              '    # не комментарий\n'
+              '    """\n'
+              '    return s + "#"\n')
+    stripped = pyparser.strip_source(source, "python")
+    assert "комментарий" not in stripped.replace("# не комментарий", "")
+    assert "# не комментарий" in stripped
+    assert 'return s + "#"' in stripped
+    ast.parse(stripped)
+    assert ast.dump(ast.parse(stripped)).count("FunctionDef") == 1
+
+
+@pytest.mark.parametrize("source, expected", [
+    ('class A:\n    x = 1\n    """Attribute doc."""\n\n\ny = 2\n', 'class A:\n    x = 1\n\ny = 2\n'),
+    ('def f():\n    """Only."""\n\n\ndef g():\n    """Doc."""\n    return 1\n',
+     'def f():\n    ...\n\ndef g():\n    return 1\n'),
+    ('def f():\n    "a"\n    "b"\n', 'def f():\n    ...\n'),
+    ('if x:\n    pass\n    "tail"\nelse:\n    "only"\n', 'if x:\n    pass\nelse:\n    ...\n'),
+    ('x = 1\n"""Module attribute doc."""\n', 'x = 1\n'),
+])
+def test_python_placeholder_only_for_emptied_blocks(source, expected):
+    stripped = pyparser.strip_source(source, "python")
+    assert stripped == expected
+    ast.parse(stripped)
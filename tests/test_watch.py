@@ -0,0 +1,92 @@
+import itertools
+import json
+import os
+import shutil
+
+import pytest
+
+import pyparser
+
+
+_runs = itertools.count()
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    (root / "pkg" / "sub").mkdir(parents=True)
+    (root / "a.py").write_text("a = 1\n", encoding="utf-8")
+    (root / "notes.md").write_text("# notes\n", encoding="utf-8")
+    (root / "pkg" / "b.py").write_text("b = 2\n", encoding="utf-8")
+    (root / "pkg" / "sub" / "c.js").write_text("var c = 3;\n", encoding="utf-8")
+    return root
+
+
+def start(root, tmp_path, **overrides):
+    parser = pyparser.make_parser(str(root), verbose=False, **overrides)
+    session = pyparser.WatchSession(parser, str(tmp_path / "code.txt"), str(tmp_path / "structure.txt"),
+                                    debounce=0, polling=True, interval=0.001, overrides=overrides)
+    assert isinstance(session.watcher, pyparser.PollingWatcher)
+    session.build()
+    return session
+
+
+def sync(session):
+    events = session.watcher.poll(0.001)
+    assert events
+    session.apply(events)
+
+
+def assert_matches_fresh_run(root, tmp_path, **overrides):
+    fresh = tmp_path / f"fresh{next(_runs)}" / root.name
+    shutil.copytree(root, fresh, ignore=shutil.ignore_patterns(".pyparser_cache", "pyparser_manifest.json"))
+    pyparser.collect(str(fresh), str(fresh.parent / "code.txt"), verbose=False, **overrides)
+    pyparser.structure(str(fresh), str(fresh.parent / "structure.txt"), verbose=False, **overrides)
+    for name in ("code.txt", "structure.txt"):
+        assert (tmp_path / name).read_text(encoding="utf-8") == (fresh.parent / name).read_text(encoding="utf-8")
+
+
+def test_watch_follows_edits_dirs_deletes_renames_and_config(project, tmp_path):
+    session = start(project, tmp_path)
+    assert_matches_fresh_run(project, tmp_path)
+
+    (project / "a.py").write_text("a = 'изменено'\n", encoding="utf-8")
+    sync(session)
+    assert_matches_fresh_run(project, tmp_path)
+
+    (project / "pkg" / "new" / "deep").mkdir(parents=True)
+    (project / "pkg" / "new" / "deep" / "d.py").write_text("d = 4\n", encoding="utf-8")
+    sync(session)
+    assert "d = 4" in (tmp_path / "code.txt").read_text(encoding="utf-8")
+    assert_matches_fresh_run(project, tmp_path)
+
+    (project / "pkg" / "b.py").unlink()
+    shutil.rmtree(project / "pkg" / "sub")
+    sync(session)
+    assert_matches_fresh_run(project, tmp_path)
+
+    os.rename(project / "a.py", project / "renamed.py")
+    os.rename(project / "pkg" / "new", project / "moved")
+    sync(session)
+    (project / "moved" / "deep" / "e.py").write_text("e = 5\n", encoding="utf-8")
+    sync(session)
+    assert_matches_fresh_run(project, tmp_path)
+
+    config = pyparser.PyParser(str(project)).default_config()
+    config["file_types"] = [".md"]
+    (project / "pyparser_config.json").write_text(json.dumps(config), encoding="utf-8")
+    sync(session)
+    assert "# Файл: ./notes.md" in (tmp_path / "code.txt").read_text(encoding="utf-8")
+    assert_matches_fresh_run(project, tmp_path)
+
+
+@pytest.mark.parametrize("overrides", [{"structure_sizes": True}, {"structure_lines": True},
+                                       {"structure_entries": 1}])
+def test_watch_refreshes_structure_totals_on_edit(project, tmp_path, overrides):
+    session = start(project, tmp_path, **overrides)
+    assert_matches_fresh_run(project, tmp_path, **overrides)
+
+    (project / "pkg" / "b.py").write_text("b = 2\n" * 500, encoding="utf-8")
+    (project / "notes.md").write_text("# notes\n" * 100, encoding="utf-8")
+    sync(session)
+    assert_matches_fresh_run(project, tmp_path, **overrides)